@@ -1,20 +1,120 @@
+from django import forms
+from django.conf import settings
 from django.contrib import admin
-from .models import Todo, Category
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db import DEFAULT_DB_ALIAS
+from django.http import HttpResponse, QueryDict
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+from .models import Todo, Category, Membership, ProfileRecord, RecurrenceRule, Workspace
+from .paginator import EstimatedCountPaginator, fast_count
+from .routers import get_shards
+
+
+def performance_mode():
+    """Return True if the admin should favour speed over exact numbers."""
+    return getattr(settings, 'ADMIN_PERFORMANCE_MODE', True)
+
+
+class ShardListFilter(admin.SimpleListFilter):
+    """Filter the todo changelist by the shard it is read from."""
+    title = 'shard'
+    parameter_name = 'shard'
+    
+    def lookups(self, request, model_admin):
+        if len(get_shards()) < 2:
+            return []
+        count = fast_count if performance_mode() else lambda queryset: queryset.count()
+        return [
+            (alias, f'{alias} ({count(Todo.objects.using(alias))})')
+            for alias in get_shards()
+        ]
+    
+    def queryset(self, request, queryset):
+        if self.value() in get_shards():
+            return queryset.using(self.value())
+        return queryset
+
+
+class CategoryAutocompleteFilter(admin.SimpleListFilter):
+    """Category filter backed by the admin autocomplete view.
+    
+    The stock related-field filter renders every category in the sidebar;
+    this one only loads the selected category and searches the rest on demand.
+    """
+    title = 'category'
+    parameter_name = 'category__id__exact'
+    template = 'admin/todo/autocomplete_filter.html'
+    
+    def __init__(self, request, params, model, model_admin):
+        super().__init__(request, params, model, model_admin)
+        field = forms.ModelChoiceField(
+            queryset=Category.objects.all(),
+            required=False,
+            widget=AutocompleteSelect(Todo._meta.get_field('category'), model_admin.admin_site),
+        )
+        self.form = type('CategoryFilterForm', (forms.Form,), {self.parameter_name: field})(
+            {self.parameter_name: self.value()}
+        )
+        self.bound_field = self.form[self.parameter_name]
+    
+    def has_output(self):
+        return True
+    
+    def lookups(self, request, model_admin):
+        return []
+    
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'display': 'All',
+            'hidden_params': [
+                (key, value)
+                for key, values in changelist.params.items()
+                if key not in (self.parameter_name, 'p')
+                for value in (values if isinstance(values, list) else [values])
+            ],
+        }
+    
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(category_id=self.value())
+        return queryset
+
+
+class RecurrenceRuleInline(admin.StackedInline):
+    """Inline for the rule that makes a todo repeat."""
+    model = RecurrenceRule
+    fields = ['frequency', 'interval', 'until', 'count']
+    extra = 0
+    max_num = 1
 
 
 @admin.register(Todo)
 class TodoAdmin(admin.ModelAdmin):
-    """Admin configuration for Todo model."""
-    list_display = ['title', 'user', 'category', 'completed', 'created_at', 'due_date']
-    list_filter = ['completed', 'category', 'created_at']
+    """Admin configuration for Todo model.
+    
+    With ADMIN_PERFORMANCE_MODE on, the changelist uses estimated or cached
+    counts, joins users and categories in the list query (or prefetches
+    them, when browsing a shard other than the default database), and
+    replaces the full category sidebar with an autocomplete filter.
+    """
+    list_display = ['title', 'user', 'workspace', 'category', 'completed', 'created_at', 'due_date']
+    list_filter = [ShardListFilter, 'completed', 'category', 'created_at']
+    list_select_related = ['user', 'workspace', 'category']
+    autocomplete_fields = ['user', 'workspace', 'category']
     search_fields = ['title', 'description']
     readonly_fields = ['created_at', 'updated_at']
+    inlines = [RecurrenceRuleInline]
     fieldsets = (
         ('Basic Info', {
             'fields': ('title', 'description', 'user')
         }),
         ('Organization', {
-            'fields': ('category',)
+            'fields': ('workspace', 'category')
         }),
         ('Status', {
             'fields': ('completed',)
@@ -24,11 +124,155 @@ class TodoAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+    
+    @property
+    def show_full_result_count(self):
+        # Skip the second, unfiltered COUNT(*) behind "N total".
+        return not performance_mode()
+    
+    @property
+    def media(self):
+        media = super().media
+        if performance_mode():
+            widget = AutocompleteSelect(Todo._meta.get_field('category'), self.admin_site)
+            media += widget.media
+        return media
+    
+    def browses_other_shard(self, request):
+        """Return True if the changelist reads from a shard other than the users' database."""
+        alias = request.GET.get(ShardListFilter.parameter_name)
+        return alias in get_shards() and alias != DEFAULT_DB_ALIAS
+    
+    def get_list_select_related(self, request):
+        # Users, workspaces and categories only live on the default
+        # database; joining them on another shard would match no rows.
+        if self.browses_other_shard(request):
+            return []
+        return self.list_select_related
+    
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if self.browses_other_shard(request):
+            # Load them in one query per model instead of one per row.
+            queryset = queryset.prefetch_related(*self.list_select_related)
+        return queryset
+    
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        paginator_class = EstimatedCountPaginator if performance_mode() else self.paginator
+        return paginator_class(queryset, per_page, orphans, allow_empty_first_page)
+    
+    def get_list_filter(self, request):
+        if not performance_mode():
+            return self.list_filter
+        return [
+            CategoryAutocompleteFilter if name == 'category' else name
+            for name in self.list_filter
+        ]
+    
+    def get_formset_kwargs(self, request, obj, inline, prefix):
+        kwargs = super().get_formset_kwargs(request, obj, inline, prefix)
+        # Inline rows (recurrence rules) are stored on the todo's shard.
+        if obj is not None and obj._state.db is not None:
+            kwargs['queryset'] = kwargs['queryset'].using(obj._state.db)
+        return kwargs
+    
+    def save_formset(self, request, form, formset, change):
+        # Rules carry the todo's user so they are sharded alongside it.
+        for rule in formset.save(commit=False):
+            rule.user_id = form.instance.user_id
+            rule.save()
+        for rule in formset.deleted_objects:
+            rule.delete()
+    
+    def get_object(self, request, object_id, from_field=None):
+        """Look the todo up on the shard being browsed, then on the others.
+        
+        Todos created before ids were allocated per shard may share an id
+        with a todo on another shard, so the shard selected in the changelist
+        (kept in the preserved filters) wins over the rest.
+        """
+        preserved = QueryDict(request.GET.get('_changelist_filters', ''))
+        hinted = request.GET.get('shard') or preserved.get('shard')
+        shards = sorted(get_shards(), key=lambda alias: alias != hinted)
+        field = Todo._meta.get_field(from_field) if from_field else Todo._meta.pk
+        for alias in shards:
+            try:
+                return self.get_queryset(request).using(alias).get(
+                    **{field.name: field.to_python(object_id)}
+                )
+            except (Todo.DoesNotExist, ValidationError, ValueError):
+                continue
+        return None
 
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     """Admin configuration for Category model."""
-    list_display = ['name', 'created_at']
+    list_display = ['name', 'workspace', 'created_at']
+    list_select_related = ['workspace']
+    autocomplete_fields = ['workspace']
     search_fields = ['name', 'description']
     readonly_fields = ['created_at']
+
+
+class MembershipInline(admin.TabularInline):
+    """Inline for a workspace's members."""
+    model = Membership
+    extra = 0
+    autocomplete_fields = ['user']
+    readonly_fields = ['created_at']
+
+
+@admin.register(Workspace)
+class WorkspaceAdmin(admin.ModelAdmin):
+    """Admin configuration for Workspace model."""
+    list_display = ['name', 'personal_for', 'created_at']
+    list_select_related = ['personal_for']
+    search_fields = ['name']
+    autocomplete_fields = ['personal_for']
+    readonly_fields = ['created_at']
+    inlines = [MembershipInline]
+
+
+@admin.register(ProfileRecord)
+class ProfileRecordAdmin(admin.ModelAdmin):
+    """Admin configuration for request profiles; read-only."""
+    list_display = ['created_at', 'method', 'path', 'view_name', 'status_code', 'duration_ms', 'sample_count', 'user']
+    list_filter = ['view_name', 'method']
+    search_fields = ['path', 'view_name']
+    fields = ['created_at', 'user', 'method', 'path', 'view_name', 'status_code', 'duration_ms',
+              'sample_count', 'flamegraph_download', 'summary_text']
+    readonly_fields = fields
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def get_urls(self):
+        return [
+            path(
+                '<int:object_id>/collapsed/',
+                self.admin_site.admin_view(self.collapsed_view),
+                name='todo_profilerecord_collapsed',
+            ),
+        ] + super().get_urls()
+    
+    def collapsed_view(self, request, object_id):
+        """Download the collapsed stacks, ready for flamegraph.pl or speedscope."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        record = get_object_or_404(ProfileRecord, pk=object_id)
+        response = HttpResponse(record.collapsed, content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="profile-{record.pk}.folded"'
+        return response
+    
+    @admin.display(description='Flamegraph')
+    def flamegraph_download(self, obj):
+        url = reverse('admin:todo_profilerecord_collapsed', args=[obj.pk])
+        return format_html('<a href="{}">Download collapsed stacks</a> ({} samples)', url, obj.sample_count)
+    
+    @admin.display(description='Summary')
+    def summary_text(self, obj):
+        return format_html('<pre style="white-space: pre; overflow-x: auto;">{}</pre>', obj.summary)
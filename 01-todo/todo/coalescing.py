@@ -0,0 +1,71 @@
+"""Coalescing of bursts of edits to the same todo into one write.
+
+Used by the JSON edit endpoint (views.patch_todo). The first edit to a row
+waits for TODO_WRITE_COALESCE_SECONDS; edits to the same row arriving in
+the meantime are merged into it, later values winning, and everything is
+written at once. Every request waits for that write, so a response still
+means the edit is stored.
+
+Edits are only merged with others handled by the same event loop, which
+under ASGI means the same worker process. Under WSGI each request runs in
+its own loop, so the window only adds latency there: leave it at 0.
+"""
+import asyncio
+import weakref
+
+from django.conf import settings
+
+
+class _Batch:
+    def __init__(self, changes):
+        self.changes = dict(changes)
+        self.edits = 1
+        self.done = asyncio.get_running_loop().create_future()
+
+
+class WriteCoalescer:
+    """Merge edits to the same key arriving within `window` seconds."""
+
+    def __init__(self, window):
+        self.window = window
+        self._pending = {}
+
+    async def submit(self, key, changes, write):
+        """Queue `changes` for `key`; return (write(merged changes), edits merged).
+
+        `write` is an async callable applying a dict of changes.
+        """
+        batch = self._pending.get(key)
+        if batch is not None:
+            batch.changes.update(changes)
+            batch.edits += 1
+            return await asyncio.shield(batch.done), batch.edits
+
+        batch = self._pending[key] = _Batch(changes)
+        try:
+            await asyncio.sleep(self.window)
+            # Edits arriving from here on start a new batch.
+            del self._pending[key]
+            result = await write(batch.changes)
+        except BaseException as exc:
+            self._pending.pop(key, None)
+            if batch.edits > 1:
+                batch.done.set_exception(exc if isinstance(exc, Exception) else asyncio.CancelledError())
+            raise
+        batch.done.set_result(result)
+        return result, batch.edits
+
+
+_coalescers = weakref.WeakKeyDictionary()
+
+
+def get_coalescer():
+    """Return the coalescer of the running event loop, or None when coalescing is off."""
+    window = getattr(settings, 'TODO_WRITE_COALESCE_SECONDS', 0)
+    if not window:
+        return None
+    loop = asyncio.get_running_loop()
+    coalescer = _coalescers.get(loop)
+    if coalescer is None or coalescer.window != window:
+        coalescer = _coalescers[loop] = WriteCoalescer(window)
+    return coalescer
@@ -0,0 +1,71 @@
+"""Content-encoding helpers shared by the compression middleware and static files.
+
+Brotli is used when the optional ``brotli`` package is installed; gzip is
+always available.
+"""
+import gzip
+import re
+
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+
+# Mirrors GZipMiddleware: random padding in the gzip header mitigates BREACH.
+MAX_RANDOM_BYTES = 100
+
+# Brotli has no header field to hide such padding in, so dynamic responses
+# of these types, which carry CSRF tokens next to user input, are only
+# ever gzipped.
+GZIP_ONLY_TYPES = ('text/html',)
+
+_accept_re = re.compile(r'\s*([^\s;,]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?')
+
+
+def available_encodings():
+    """Return the encodings this process can produce, best first."""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def response_encodings(content_type):
+    """Return the encodings a dynamic response of this content type may use, best first."""
+    if content_type.startswith(GZIP_ONLY_TYPES):
+        return ['gzip']
+    return available_encodings()
+
+
+def choose_encoding(accept_encoding, encodings=None):
+    """Return the best encoding the client accepts, or None."""
+    accepted = {}
+    for part in accept_encoding.split(','):
+        match = _accept_re.match(part)
+        if not match:
+            continue
+        name, quality = match.group(1).lower(), match.group(2)
+        try:
+            accepted[name] = float(quality) if quality is not None else 1.0
+        except ValueError:
+            continue
+    if encodings is None:
+        encodings = available_encodings()
+    for encoding in encodings:
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(data, encoding, static=False):
+    """Compress bytes with the given content-coding.
+
+    Responses are compressed quickly, and gzip pads them (see
+    response_encodings() for brotli); static files are compressed once at
+    build time, so they get the slowest, smallest setting instead.
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if static else 5)
+    if static:
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return compress_string(data, max_random_bytes=MAX_RANDOM_BYTES)
@@ -1,9 +1,17 @@
 from django import forms
 from .models import Todo, Category
+from .recurrence import FREQUENCY_CHOICES
 
 
 class TodoForm(forms.ModelForm):
     """Form for creating and updating todos."""
+    repeat = forms.ChoiceField(
+        choices=[('', 'Does not repeat')] + FREQUENCY_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={
+            'class': 'form-control'
+        }),
+    )
     
     class Meta:
         model = Todo
@@ -32,9 +40,15 @@ class TodoForm(forms.ModelForm):
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.fields['category'].queryset = Category.tenant_objects.all()
         # Set completed to False by default for new todos
         if not self.instance.pk:
             self.fields['completed'].initial = False
+        # Occurrences materialized from a recurring todo cannot repeat themselves
+        if self.instance.recurrence_parent_id:
+            del self.fields['repeat']
+        elif self.instance.pk and hasattr(self.instance, 'recurrence'):
+            self.fields['repeat'].initial = self.instance.recurrence.frequency
 
 
 class CategoryForm(forms.ModelForm):
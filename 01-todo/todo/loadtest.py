@@ -0,0 +1,257 @@
+"""Asyncio load generator for the todo endpoints.
+
+Each virtual user logs in through the admin login form (LOGIN_URL) and then
+replays a weighted mix of list/create/toggle/delete requests over its own
+keep-alive connection until the run ends. Only the standard library is
+used, so the generator can run from any machine that can reach the server.
+See the ``loadtest`` management command for seeding and server startup.
+"""
+import asyncio
+import random
+import re
+import time
+from collections import Counter, defaultdict
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+DEFAULT_MIX = {'list': 60, 'create': 20, 'toggle': 12, 'delete': 8}
+
+# Upper bounds of the latency histogram buckets, in milliseconds.
+HISTOGRAM_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float('inf')]
+
+TODO_ID_RE = re.compile(rb'/todos/(\d+)/toggle/')
+
+
+class HTTPError(Exception):
+    """Raised when a response cannot be read or has an unexpected status."""
+
+
+class Connection:
+    """A minimal HTTP/1.1 client with cookies and keep-alive."""
+
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.cookies = {}
+        self.reader = self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def request(self, method, path, data=None):
+        """Send one request and return (status, headers, body)."""
+        for attempt in range(2):
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            try:
+                return await asyncio.wait_for(self._exchange(method, path, data), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # The server closed an idle keep-alive connection; retry once.
+                await self.close()
+                if attempt:
+                    raise
+
+    async def _exchange(self, method, path, data):
+        body = urlencode(data).encode() if data is not None else b''
+        headers = {
+            'Host': f'{self.host}:{self.port}',
+            'Connection': 'keep-alive',
+            'Content-Length': str(len(body)),
+        }
+        if data is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if 'csrftoken' in self.cookies:
+            headers['X-CSRFToken'] = self.cookies['csrftoken']
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        head = f'{method} {path} HTTP/1.1\r\n' + ''.join(f'{k}: {v}\r\n' for k, v in headers.items())
+        self.writer.write(head.encode('latin-1') + b'\r\n' + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readuntil(b'\r\n')
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            raise HTTPError(f'Malformed status line: {status_line!r}')
+        response_headers = []
+        while True:
+            line = await self.reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers.append((name.strip().lower(), value.strip()))
+
+        for name, value in response_headers:
+            if name == 'set-cookie':
+                for morsel in SimpleCookie(value).values():
+                    if morsel['max-age'] == '0' or not morsel.value:
+                        self.cookies.pop(morsel.key, None)
+                    else:
+                        self.cookies[morsel.key] = morsel.value
+
+        header_map = dict(response_headers)
+        if header_map.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                if size == 0:
+                    await self.reader.readuntil(b'\r\n')
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readexactly(2)
+            response_body = b''.join(chunks)
+        elif 'content-length' in header_map:
+            response_body = await self.reader.readexactly(int(header_map['content-length']))
+        else:
+            response_body = await self.reader.read()
+            header_map['connection'] = 'close'
+
+        if header_map.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, header_map, response_body
+
+
+# Lines that chain one traceback to the next in a server log.
+CHAINED_TRACEBACK_MARKERS = (
+    'The above exception was the direct cause of the following exception:',
+    'During handling of the above exception, another exception occurred:',
+)
+
+
+class Stats:
+    """Latency, status and error counters collected during a run."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = Counter()
+        self.errors = Counter()
+
+    def record(self, action, seconds, status=None, error=None, expect=(200, 302)):
+        """Record one request; a status outside `expect` counts as an error."""
+        self.latencies[action].append(seconds * 1000)
+        if error is not None:
+            self.errors[f'{action}: {error}'] += 1
+            return
+        self.statuses[status] += 1
+        if status not in expect:
+            self.errors[f'{action}: HTTP {status}'] += 1
+
+    @property
+    def total(self):
+        return sum(len(values) for values in self.latencies.values())
+
+    @property
+    def failed(self):
+        return sum(self.errors.values())
+
+    @staticmethod
+    def percentile(values, fraction):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+    def histogram(self, action=None):
+        """Return [(bucket upper bound ms, count)] for one action or all of them."""
+        values = self.latencies[action] if action else [v for vs in self.latencies.values() for v in vs]
+        counts = Counter()
+        for value in values:
+            counts[next(bound for bound in HISTOGRAM_BUCKETS if value <= bound)] += 1
+        return [(bound, counts[bound]) for bound in HISTOGRAM_BUCKETS]
+
+
+def count_tracebacks(log, message):
+    """Count the tracebacks in a server log that end with `message`.
+
+    A chained traceback repeats the message for each exception in the
+    chain (sqlite3's, then django.db.utils'); only the last one counts.
+    """
+    lines = [line for line in log.splitlines() if line.strip()]
+    return sum(
+        1
+        for index, line in enumerate(lines)
+        if not line[:1].isspace()
+        and line.endswith(message)
+        and (index + 1 == len(lines) or lines[index + 1].strip() not in CHAINED_TRACEBACK_MARKERS)
+    )
+
+
+async def virtual_user(base_url, username, password, mix, deadline, stats, timeout):
+    """Log in as one user and replay the request mix until the deadline."""
+    connection = Connection(base_url, timeout)
+    todo_ids = []
+    actions, weights = zip(*mix.items())
+
+    async def timed(action, method, path, data=None, expect=(200,)):
+        start = time.perf_counter()
+        try:
+            status, headers, body = await connection.request(method, path, data)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, HTTPError) as exc:
+            stats.record(action, time.perf_counter() - start, error=type(exc).__name__)
+            await connection.close()
+            return None
+        stats.record(action, time.perf_counter() - start, status=status, expect=expect)
+        if status not in expect:
+            return None
+        return body
+
+    try:
+        await timed('login', 'GET', '/admin/login/?next=/todos/')
+        await timed('login', 'POST', '/admin/login/?next=/todos/', {
+            'username': username,
+            'password': password,
+            'next': '/todos/',
+            'csrfmiddlewaretoken': connection.cookies.get('csrftoken', ''),
+        }, expect=(302,))
+        if 'sessionid' not in connection.cookies:
+            stats.errors['login: rejected'] += 1
+            return
+
+        while time.monotonic() < deadline:
+            action = random.choices(actions, weights)[0]
+            if action in ('toggle', 'delete') and not todo_ids:
+                action = 'list'
+            if action == 'list':
+                body = await timed('list', 'GET', '/todos/')
+                if body is not None:
+                    todo_ids[:] = [int(match) for match in TODO_ID_RE.findall(body)]
+            elif action == 'create':
+                await timed('create', 'POST', '/todos/create/', {
+                    'title': f'Load test {random.randrange(10 ** 6)}',
+                    'description': 'Created by the load generator',
+                }, expect=(302,))
+            elif action == 'toggle':
+                await timed('toggle', 'POST', f'/todos/{random.choice(todo_ids)}/toggle/', {}, expect=(302,))
+            else:
+                todo_id = todo_ids.pop(random.randrange(len(todo_ids)))
+                await timed('delete', 'POST', f'/todos/{todo_id}/delete/', {}, expect=(302,))
+    finally:
+        await connection.close()
+
+
+async def run_load(base_url, credentials, duration, mix=None, timeout=30, ramp_up=0):
+    """Run one virtual user per (username, password) for `duration` seconds.
+
+    Returns (Stats, elapsed seconds).
+    """
+    stats = Stats()
+    start = time.monotonic()
+    deadline = start + duration
+    mix = mix or DEFAULT_MIX
+
+    async def delayed(index, username, password):
+        if ramp_up:
+            await asyncio.sleep(ramp_up * index / len(credentials))
+        await virtual_user(base_url, username, password, mix, deadline, stats, timeout)
+
+    await asyncio.gather(*(
+        delayed(index, username, password)
+        for index, (username, password) in enumerate(credentials)
+    ))
+    return stats, time.monotonic() - start
@@ -0,0 +1,92 @@
+"""Helpers shared by the bench_* management commands.
+
+Benchmarks run against the configured databases inside transactions that
+are always rolled back, so they leave no rows behind.
+"""
+import statistics
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import Client
+
+from todo.models import Category, Todo
+from todo.routers import get_shards, shard_for_user
+
+BENCH_PASSWORD = 'bench-pass-123'
+
+
+@contextmanager
+def rolled_back():
+    """Run the block in transactions on every database, then roll them back."""
+    with ExitStack() as stack:
+        for alias in {DEFAULT_DB_ALIAS, *get_shards()}:
+            stack.enter_context(transaction.atomic(using=alias))
+        yield
+        for alias in {DEFAULT_DB_ALIAS, *get_shards()}:
+            transaction.set_rollback(True, using=alias)
+
+
+def create_bench_user(rows=0):
+    """Create a throwaway user owning `rows` todos spread over a few categories."""
+    user = User.objects.create_user(f'bench-{uuid.uuid4().hex[:12]}', password=BENCH_PASSWORD)
+    categories = [Category.objects.create(name=f'Bench {n}') for n in range(5)]
+    Todo.objects.using(shard_for_user(user.pk)).bulk_create([
+        Todo(
+            title=f'Benchmark todo {n}',
+            description='A moderately long description so rows have realistic weight ' * 2,
+            user=user,
+            category=categories[n % len(categories)],
+            completed=n % 3 == 0,
+        )
+        for n in range(rows)
+    ])
+    return user
+
+
+def logged_in_client(user):
+    """Return a test client logged in as a user made by create_bench_user()."""
+    client = Client(HTTP_HOST='localhost')
+    client.login(username=user.username, password=BENCH_PASSWORD)
+    return client
+
+
+class QueryCounter:
+    """Count the queries run on the default database, without a size limit."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = connections[DEFAULT_DB_ALIAS].execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+
+
+def measure(client, path, repeat, **extra):
+    """Request `path` `repeat` times and return (latencies, query counts, last response)."""
+    latencies, queries = [], []
+    response = None
+    for _ in range(repeat):
+        with QueryCounter() as counter:
+            start = time.perf_counter()
+            response = client.get(path, **extra)
+            latencies.append(time.perf_counter() - start)
+        queries.append(counter.count)
+    return latencies, queries, response
+
+
+def summarize(latencies):
+    """Return the mean and p95 of a list of latencies, in milliseconds."""
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return statistics.mean(ordered) * 1000, p95 * 1000
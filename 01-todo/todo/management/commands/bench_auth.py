@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.urls import reverse
+
+from todo.user_cache import user_cache_enabled
+
+from ._bench import create_bench_user, logged_in_client, measure, rolled_back, summarize
+
+STOCK_AUTH = 'django.contrib.auth.middleware.AuthenticationMiddleware'
+CACHED_AUTH = 'todo.middleware.CachedAuthenticationMiddleware'
+
+
+class Command(BaseCommand):
+    help = "Compare per-request queries and latency of todo_list across session/auth setups."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--rows', type=int, default=20, help="Todos owned by the benchmark user.")
+
+    def handle(self, *args, **options):
+        stock_middleware = [
+            STOCK_AUTH if name == CACHED_AUTH else name for name in settings.MIDDLEWARE
+        ]
+        fast_middleware = [
+            CACHED_AUTH if name == STOCK_AUTH else name for name in settings.MIDDLEWARE
+        ]
+        profiles = [
+            ('db session + stock auth', 'django.contrib.sessions.backends.db', stock_middleware),
+            ('cached_db session + cached auth', 'django.contrib.sessions.backends.cached_db', fast_middleware),
+            ('signed cookie + cached auth', 'django.contrib.sessions.backends.signed_cookies', fast_middleware),
+        ]
+
+        if not user_cache_enabled():
+            self.stdout.write(self.style.WARNING(
+                "The default cache is private to this process, so cached auth cannot cache "
+                "the user; configure a shared cache backend to measure it."
+            ))
+        self.stdout.write(f"{'profile':<34}{'queries/req':>12}{'mean ms':>10}{'p95 ms':>10}")
+        with rolled_back():
+            user = create_bench_user(options['rows'])
+            for label, engine, middleware in profiles:
+                with override_settings(SESSION_ENGINE=engine, MIDDLEWARE=middleware):
+                    client = logged_in_client(user)
+                    measure(client, reverse('todo_list'), 5)  # warm caches
+                    latencies, queries, _ = measure(client, reverse('todo_list'), options['requests'])
+                mean, p95 = summarize(latencies)
+                self.stdout.write(
+                    f"{label:<34}{sum(queries) / len(queries):>12.1f}{mean:>10.2f}{p95:>10.2f}"
+                )
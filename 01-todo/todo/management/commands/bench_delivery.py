@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+
+from todo.compression import available_encodings
+
+from ._bench import create_bench_user, logged_in_client, measure, rolled_back, summarize
+
+
+class Command(BaseCommand):
+    help = "Measure bytes on the wire and time to first byte of a large todo_list page."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000)
+        parser.add_argument('--requests', type=int, default=20)
+
+    def handle(self, *args, **options):
+        encodings = ['identity', *available_encodings()]
+
+        self.stdout.write(f"todo_list with {options['rows']} rows")
+        self.stdout.write(f"{'encoding':<10}{'bytes':>10}{'ratio':>8}{'ttfb mean ms':>14}{'p95 ms':>10}")
+        with rolled_back():
+            client = logged_in_client(create_bench_user(options['rows']))
+            measure(client, reverse('todo_list'), 2)  # warm caches
+            baseline = None
+            for encoding in encodings:
+                # The test client buffers the whole response, so the time to
+                # first byte is the server-side time to build and encode it.
+                latencies, _, response = measure(
+                    client, reverse('todo_list'), options['requests'], HTTP_ACCEPT_ENCODING=encoding
+                )
+                size = len(response.content)
+                baseline = baseline or size
+                mean, p95 = summarize(latencies)
+                self.stdout.write(
+                    f"{encoding:<10}{size:>10}{size / baseline:>8.2f}{mean:>14.2f}{p95:>10.2f}"
+                )
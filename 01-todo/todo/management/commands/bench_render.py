@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from ._bench import QueryCounter, create_bench_user, logged_in_client, measure, rolled_back, summarize
+
+
+class Command(BaseCommand):
+    help = "Measure how long todo_list takes to build and render home.html for large lists."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--requests', type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'rows':>7}{'request ms':>12}{'p95 ms':>10}{'queries':>9}{'template ms':>13}{'queries':>9}"
+        )
+        # Instrumented rendering makes the test client keep the view's context.
+        setup_test_environment()
+        try:
+            for rows in options['rows']:
+                self.bench(rows, options['requests'])
+        finally:
+            teardown_test_environment()
+
+    def bench(self, rows, repeat):
+        with rolled_back():
+            client = logged_in_client(create_bench_user(rows))
+            measure(client, reverse('todo_list'), 1)  # warm caches
+            latencies, queries, response = measure(
+                client, reverse('todo_list'), repeat, HTTP_ACCEPT_ENCODING='identity'
+            )
+            template_latencies, template_queries = self.render_only(response, repeat)
+        mean, p95 = summarize(latencies)
+        template_mean, _ = summarize(template_latencies)
+        self.stdout.write(
+            f"{rows:>7}{mean:>12.1f}{p95:>10.1f}{max(queries):>9}"
+            f"{template_mean:>13.1f}{max(template_queries):>9}"
+        )
+
+    def render_only(self, response, repeat):
+        """Re-render home.html from the view's context, without running the view."""
+        context = response.context[0].flatten()
+        request = context.pop('request')
+        latencies, queries = [], []
+        for _ in range(repeat):
+            with QueryCounter() as counter:
+                start = time.perf_counter()
+                render_to_string('todo/home.html', context, request)
+                latencies.append(time.perf_counter() - start)
+            queries.append(counter.count)
+        return latencies, queries
@@ -0,0 +1,124 @@
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Each scenario is the argument list given to a fresh Python interpreter.
+SCENARIOS = {
+    # Configure Django and load every app, as any entry point does.
+    'setup': ['-c', 'import django; django.setup()'],
+    # A batch command that only needs the ORM.
+    'command': ['manage.py', 'rebalance_shards', '--dry-run'],
+    # A cold worker: load the WSGI application and answer its first request.
+    'worker': ['-c', (
+        'from wsgiref.util import setup_testing_defaults\n'
+        'from todoproject.wsgi import application\n'
+        'environ = {"HTTP_HOST": "localhost", "PATH_INFO": "/todos/"}\n'
+        'setup_testing_defaults(environ)\n'
+        'application(environ, lambda status, headers: None)\n'
+    )],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure how long fresh interpreters take to start Django, run a batch "
+        "command and serve a first request, optionally with an -X importtime report."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=20)
+        parser.add_argument(
+            '--settings-module',
+            action='append',
+            dest='settings_modules',
+            help="Settings module to compare; repeat to compare several "
+                 "(default: todoproject.settings and todoproject.settings_batch).",
+        )
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=sorted(SCENARIOS))
+        parser.add_argument(
+            '--importtime',
+            type=int,
+            default=0,
+            metavar='N',
+            help="Also print the N packages that take longest to import, per scenario.",
+        )
+
+    def handle(self, *args, **options):
+        modules = options['settings_modules'] or ['todoproject.settings', 'todoproject.settings_batch']
+        scenarios = options['scenarios'] or list(SCENARIOS)
+
+        cases = [
+            (scenario, module)
+            for scenario in scenarios
+            for module in modules
+            # The batch profile has no URLs to serve.
+            if not (scenario == 'worker' and module.endswith('_batch'))
+        ]
+
+        # Interleave the cases so drift in machine load affects them all alike.
+        timings = {case: [] for case in cases}
+        cpu_times = {case: [] for case in cases}
+        for _ in range(options['runs']):
+            for case in cases:
+                elapsed, cpu, _ = self.run(*case)
+                timings[case].append(elapsed)
+                cpu_times[case].append(cpu)
+
+        self.stdout.write(f"{'scenario':<10}{'settings':<30}{'median ms':>11}{'min ms':>9}{'cpu ms':>9}")
+        for case, values in timings.items():
+            scenario, module = case
+            self.stdout.write(
+                f"{scenario:<10}{module:<30}{statistics.median(values) * 1000:>11.0f}"
+                f"{min(values) * 1000:>9.0f}{statistics.median(cpu_times[case]) * 1000:>9.0f}"
+            )
+
+        if options['importtime']:
+            for case in cases:
+                self.report_imports(*case, options['importtime'])
+
+    def run(self, scenario, module, *python_options):
+        """Run a scenario in a new interpreter; return (wall seconds, CPU seconds, stderr).
+
+        CPU time is far less sensitive than wall time to other load on the machine.
+        """
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=module)
+        command = [sys.executable, *python_options, *SCENARIOS[scenario]]
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        start = time.perf_counter()
+        result = subprocess.run(
+            command, cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        )
+        elapsed = time.perf_counter() - start
+        after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu = (after.ru_utime + after.ru_stime) - (usage.ru_utime + usage.ru_stime)
+        if result.returncode:
+            raise CommandError(f"{scenario} failed with {module}:\n{result.stderr[-2000:]}")
+        return elapsed, cpu, result.stderr
+
+    def report_imports(self, scenario, module, limit):
+        """Print the packages with the highest total import time under -X importtime."""
+        _, _, stderr = self.run(scenario, module, '-X', 'importtime')
+        packages = Counter()
+        total = 0
+        for line in stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, _, name = line[len('import time:'):].split('|')
+            name = name.strip()
+            parts = name.split('.')
+            # django.contrib.admin rather than django.contrib, django.db rather than django.
+            depth = 3 if parts[:2] == ['django', 'contrib'] else 2
+            packages['.'.join(parts[:depth])] += int(self_us)
+            total += int(self_us)
+
+        self.stdout.write('')
+        self.stdout.write(f"Import time, {scenario} with {module}: {total / 1000:.0f} ms in total")
+        for package, microseconds in packages.most_common(limit):
+            self.stdout.write(f"  {package:<40}{microseconds / 1000:>8.1f} ms")
@@ -0,0 +1,160 @@
+import asyncio
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from todo.loadtest import DEFAULT_MIX, count_tracebacks, run_load
+
+USERNAME_PREFIX = 'loadtest-user-'
+PASSWORD = 'loadtest-pass-123'
+
+SERVERS = {
+    'wsgi': ('gunicorn', ['todoproject.wsgi:application', '--workers', '{workers}', '--bind', '127.0.0.1:{port}']),
+    'asgi': ('uvicorn', ['todoproject.asgi:application', '--workers', '{workers}', '--host', '127.0.0.1', '--port', '{port}']),
+}
+
+LOCK_ERROR = 'OperationalError: database is locked'
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the todo endpoints with seeded users, against a local gunicorn "
+        "(wsgi) or uvicorn (asgi) server with N workers, or against --url."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=sorted(SERVERS), default='wsgi')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--url', help="Target an already running server instead of starting one.")
+        parser.add_argument('--users', type=int, default=20, help="Concurrent virtual users.")
+        parser.add_argument('--duration', type=float, default=30, help="Seconds to run.")
+        parser.add_argument('--ramp-up', type=float, default=0, help="Seconds over which users start.")
+        parser.add_argument(
+            '--mix',
+            default=','.join(f'{action}={weight}' for action, weight in DEFAULT_MIX.items()),
+            help="Weighted request mix, e.g. list=60,create=20,toggle=12,delete=8.",
+        )
+
+    def handle(self, *args, **options):
+        mix = self.parse_mix(options['mix'])
+        credentials = self.seed_users(options['users'])
+
+        log = tempfile.NamedTemporaryFile('w+', prefix='loadtest-server-', suffix='.log', delete=False)
+        server = None
+        try:
+            if options['url']:
+                base_url = options['url'].rstrip('/')
+            else:
+                base_url = f"http://127.0.0.1:{options['port']}"
+                server = self.start_server(options['server'], options['workers'], options['port'], log)
+            self.stdout.write(
+                f"Running {options['users']} users for {options['duration']}s against {base_url} ..."
+            )
+            stats, elapsed = asyncio.run(run_load(
+                base_url, credentials, options['duration'], mix, ramp_up=options['ramp_up'],
+            ))
+        finally:
+            if server is not None:
+                server.terminate()
+                try:
+                    server.wait(10)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+            log.seek(0)
+            server_log = log.read()
+            log.close()
+
+        self.report(stats, elapsed, server_log if server is not None else None)
+        self.stdout.write(f"Server log: {log.name}")
+
+    def parse_mix(self, value):
+        try:
+            mix = {
+                action.strip(): int(weight)
+                for action, weight in (part.split('=') for part in value.split(','))
+            }
+        except ValueError:
+            raise CommandError(f"Invalid --mix {value!r}.")
+        unknown = set(mix) - set(DEFAULT_MIX)
+        if unknown:
+            raise CommandError(f"Unknown actions in --mix: {', '.join(sorted(unknown))}.")
+        return mix
+
+    def seed_users(self, count):
+        """Create staff users able to log in through the admin login form."""
+        credentials = []
+        for number in range(count):
+            user, created = User.objects.get_or_create(
+                username=f'{USERNAME_PREFIX}{number}', defaults={'is_staff': True}
+            )
+            if created:
+                user.set_password(PASSWORD)
+                user.save()
+            credentials.append((user.username, PASSWORD))
+        return credentials
+
+    def start_server(self, kind, workers, port, log):
+        module, arguments = SERVERS[kind]
+        if importlib.util.find_spec(module) is None:
+            raise CommandError(f"The {kind} profile needs {module}: pip install {module}")
+        with socket.socket() as probe:
+            if probe.connect_ex(('127.0.0.1', port)) == 0:
+                raise CommandError(f"Port {port} is already in use.")
+
+        command = [sys.executable, '-m', module] + [
+            argument.format(workers=workers, port=port) for argument in arguments
+        ]
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'todoproject.settings'))
+        self.stdout.write(f"Starting {' '.join(command[2:])}")
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                log.seek(0)
+                raise CommandError(f"Server exited early:\n{log.read()[-2000:]}")
+            with socket.socket() as probe:
+                if probe.connect_ex(('127.0.0.1', port)) == 0:
+                    return server
+            time.sleep(0.2)
+        server.kill()
+        raise CommandError("Server did not start within 30 seconds.")
+
+    def report(self, stats, elapsed, server_log):
+        total = stats.total
+        self.stdout.write('')
+        self.stdout.write(f"Requests:   {total} in {elapsed:.1f}s ({total / elapsed:.1f} req/s)")
+        self.stdout.write(f"Errors:     {stats.failed} ({stats.failed / max(total, 1):.2%})")
+        self.stdout.write(
+            "Statuses:   " + ', '.join(f'{status}: {count}' for status, count in sorted(stats.statuses.items()))
+        )
+        for error, count in stats.errors.most_common():
+            self.stdout.write(f"  {error}: {count}")
+        if server_log is not None:
+            self.stdout.write(f"DB locks:   {count_tracebacks(server_log, LOCK_ERROR)} 'database is locked' errors")
+
+        self.stdout.write('')
+        self.stdout.write(f"{'action':<8}{'count':>8}{'req/s':>8}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+        for action, values in sorted(stats.latencies.items()):
+            self.stdout.write(
+                f"{action:<8}{len(values):>8}{len(values) / elapsed:>8.1f}"
+                f"{stats.percentile(values, 0.5):>9.1f}{stats.percentile(values, 0.9):>9.1f}"
+                f"{stats.percentile(values, 0.99):>9.1f}{max(values):>9.1f}"
+            )
+
+        self.stdout.write('')
+        self.stdout.write("Latency histogram (all requests):")
+        histogram = stats.histogram()
+        peak = max((count for _, count in histogram), default=0) or 1
+        for bound, count in histogram:
+            label = '> 5000' if bound == float('inf') else f'<= {bound:g}'
+            self.stdout.write(f"  {label:>8} ms {count:>7} {'#' * round(40 * count / peak)}")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from todo.models import TodoTombstone
+from todo.sync import tombstone_retention
+
+
+class Command(BaseCommand):
+    help = "Delete sync tombstones older than SYNC_TOMBSTONE_RETENTION_DAYS on every shard."
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - tombstone_retention()
+        total = 0
+        for alias, tombstones in TodoTombstone.objects.across_shards():
+            deleted, _ = tombstones.filter(deleted_at__lt=cutoff).delete()
+            self.stdout.write(f"{alias}: {deleted} tombstone(s) deleted")
+            total += deleted
+        self.stdout.write(self.style.SUCCESS(f"Deleted {total} tombstone(s)."))
@@ -0,0 +1,131 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from todo.models import RecurrenceRule, Todo, TodoTombstone
+from todo.routers import get_shards, shard_for_user
+
+
+class Command(BaseCommand):
+    help = "Move todos to the shard their user maps to under the current TODO_SHARDS."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Report what would move without changing anything.",
+        )
+        parser.add_argument(
+            '--source',
+            action='append',
+            default=[],
+            help="Only drain these database aliases (defaults to every shard). "
+                 "Use this to empty a shard that was removed from TODO_SHARDS.",
+        )
+
+    def handle(self, *args, **options):
+        sources = options['source'] or get_shards()
+        moved_users = moved_todos = 0
+
+        for source in sources:
+            user_ids = (
+                Todo.objects.using(source)
+                .order_by()
+                .values_list('user_id', flat=True)
+                .distinct()
+            )
+            for user_id in list(user_ids):
+                target = shard_for_user(user_id)
+                if target == source:
+                    continue
+                if options['dry_run']:
+                    count = Todo.objects.using(source).filter(user_id=user_id).count()
+                else:
+                    count = self.move_user(user_id, source, target)
+                self.stdout.write(f"user {user_id}: {count} todo(s) {source} -> {target}")
+                moved_users += 1
+                moved_todos += count
+
+        verb = "Would move" if options['dry_run'] else "Moved"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {moved_todos} todo(s) for {moved_users} user(s)."
+        ))
+
+    def move_user(self, user_id, source, target):
+        """Move one user's todos, recurrence rules and tombstones from source to target.
+
+        The rows are copied to the target and committed there before they
+        are deleted from the source, so a failure never loses them. A move
+        that stopped in between is finished by running the command again:
+        rows already copied are recognised by id, owner and creation time
+        and refreshed rather than copied twice.
+
+        Ids are kept, since URLs and sync clients refer to them. They are
+        unique across shards, except for todos created before ids were
+        allocated per shard: if an id is taken by another todo on the target,
+        nothing is moved for the user and CommandError is raised.
+        """
+        todos = list(Todo.objects.using(source).filter(user_id=user_id))
+        ids = [todo.pk for todo in todos]
+        tombstones = list(TodoTombstone.objects.using(source).filter(user_id=user_id))
+        tombstone_ids = [tombstone.pk for tombstone in tombstones]
+
+        with transaction.atomic(using=target):
+            on_target = {
+                pk: (owner, created_at)
+                for pk, owner, created_at in Todo.objects.using(target)
+                .filter(pk__in=ids)
+                .values_list('pk', 'user_id', 'created_at')
+            }
+            clashes = [
+                todo.pk for todo in todos
+                if todo.pk in on_target and on_target[todo.pk] != (todo.user_id, todo.created_at)
+            ]
+            if clashes:
+                raise CommandError(
+                    f"user {user_id}: todo id(s) {', '.join(map(str, clashes))} are taken on {target}; "
+                    f"nothing was moved for this user."
+                )
+
+            # bulk_create() stamps auto_now(_add) fields; put the originals
+            # back, and bring copies left by an earlier run up to date.
+            timestamps = [(todo.created_at, todo.updated_at) for todo in todos]
+            Todo.objects.using(target).bulk_create([todo for todo in todos if todo.pk not in on_target])
+            for todo, (created_at, updated_at) in zip(todos, timestamps):
+                todo.created_at, todo.updated_at = created_at, updated_at
+            fields = [field.name for field in Todo._meta.concrete_fields if not field.primary_key]
+            Todo.objects.using(target).bulk_update(todos, fields)
+
+            rules = list(RecurrenceRule.objects.using(source).filter(user_id=user_id))
+            RecurrenceRule.objects.using(target).filter(todo_id__in=ids).delete()
+            for rule in rules:
+                rule.pk = None
+            RecurrenceRule.objects.using(target).bulk_create(rules)
+
+            # Tombstones get fresh ids on the target; sync clients only use
+            # their deletion times.
+            copied = set(
+                TodoTombstone.objects.using(target)
+                .filter(user_id=user_id)
+                .values_list('todo_id', 'deleted_at')
+            )
+            tombstones = [
+                tombstone for tombstone in tombstones
+                if (tombstone.todo_id, tombstone.deleted_at) not in copied
+            ]
+            deleted_at = [tombstone.deleted_at for tombstone in tombstones]
+            for tombstone in tombstones:
+                tombstone.pk = None
+            TodoTombstone.objects.using(target).bulk_create(tombstones)
+            for tombstone, moment in zip(tombstones, deleted_at):
+                tombstone.deleted_at = moment
+            TodoTombstone.objects.using(target).bulk_update(tombstones, ['deleted_at'])
+
+        # Only now that the copy is committed, remove the originals.
+        # Deleting the todos leaves tombstones on the source; those go too.
+        with transaction.atomic(using=source):
+            Todo.objects.using(source).filter(pk__in=ids).delete()
+            TodoTombstone.objects.using(source).filter(
+                Q(pk__in=tombstone_ids) | Q(todo_id__in=ids), user_id=user_id
+            ).delete()
+        return len(todos)
@@ -0,0 +1,232 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+from django.utils.functional import SimpleLazyObject
+
+from .compression import choose_encoding, compress, response_encodings
+from .models import ProfileRecord, Workspace
+from .routers import pin_to_primary, unpin
+from .tenancy import activate, deactivate
+from .user_cache import get_cached_user
+
+WORKSPACE_SESSION_KEY = '_workspace_id'
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware that caches the user for the session's lifetime.
+
+    Saves the per-request User query when the cache is shared by all
+    workers (see todo.user_cache). Cached entries are dropped whenever the
+    user, their groups or their permissions change (see todo.signals).
+    """
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: self.get_user(request))
+
+    @staticmethod
+    def get_user(request):
+        if not hasattr(request, '_cached_user'):
+            request._cached_user = get_cached_user(request)
+        return request._cached_user
+
+
+def get_workspace(request):
+    """Return the request's workspace, looking it up on first use only.
+
+    That is the workspace chosen in the session, as long as the user still
+    belongs to it, or else the user's personal workspace. Anonymous users
+    have none.
+    """
+    if not hasattr(request, '_cached_workspace'):
+        request._cached_workspace = _resolve_workspace(request)
+    return request._cached_workspace
+
+
+def _resolve_workspace(request):
+    if not request.user.is_authenticated:
+        return None
+    workspace_id = request.session.get(WORKSPACE_SESSION_KEY)
+    if workspace_id is not None:
+        workspace = Workspace.objects.filter(pk=workspace_id, memberships__user=request.user).first()
+        if workspace is not None:
+            return workspace
+    workspace = Workspace.objects.personal(request.user)
+    request.session[WORKSPACE_SESSION_KEY] = workspace.pk
+    return workspace
+
+
+class WorkspaceMiddleware:
+    """Make the request's workspace current for tenant-scoped managers.
+
+    The workspace is resolved lazily, at most once per request, and is also
+    available as get_workspace(request). Must come after the authentication
+    middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = activate(lambda: get_workspace(request))
+        try:
+            return self.get_response(request)
+        finally:
+            deactivate(token)
+
+
+class ReplicaPinningMiddleware:
+    """Pin a client to the primary database for a short window after a write.
+
+    Any request with an unsafe method is served entirely from the primary and
+    sets a cookie holding the time until which that client stays pinned, so
+    the redirect that follows (and anything else inside the window) reads
+    the data it just wrote instead of a possibly lagging replica.
+    """
+
+    safe_methods = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.cookie_name = getattr(settings, 'REPLICA_PIN_COOKIE_NAME', 'primary_pin')
+        self.pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+    def __call__(self, request):
+        is_write = request.method not in self.safe_methods
+        token = pin_to_primary(is_write or self.is_pinned(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            unpin(token)
+
+        if is_write:
+            response.set_cookie(
+                self.cookie_name,
+                str(time.time() + self.pin_seconds),
+                max_age=self.pin_seconds,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def is_pinned(self, request):
+        """Return True if the request carries an unexpired pin cookie."""
+        try:
+            pinned_until = float(request.COOKIES.get(self.cookie_name, 0))
+        except ValueError:
+            return False
+        return pinned_until > time.time()
+
+
+class CompressionMiddleware:
+    """Compress text responses with brotli or gzip above a size threshold.
+
+    A lighter-weight GZipMiddleware: responses smaller than
+    COMPRESSION_MIN_SIZE bytes, streaming responses (static files are
+    served pre-compressed) and non-text content are left alone. HTML is
+    only gzipped, as brotli cannot be padded against BREACH.
+    """
+
+    compressible_types = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        content_type = response.get('Content-Type', '')
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or not content_type.startswith(self.compressible_types)
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < self.min_size:
+            return response
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), response_encodings(content_type))
+        if encoding is None:
+            return response
+
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        response.headers['Content-Encoding'] = encoding
+
+        # The ETag describes the uncompressed body; see GZipMiddleware.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        return response
+
+
+class ProfilingMiddleware:
+    """Profile a single view call when a staff user asks for it.
+
+    Send the PROFILING_HEADER header (X-Profile: 1) or add ``?__profile=1``
+    to a request. The view, including template rendering, runs under
+    cProfile and a stack sampler, and the result is stored as a
+    ProfileRecord, browsable in the admin. The response carries the record
+    id in X-Profile-Id.
+
+    Unless PROFILING_ENABLED is set the middleware removes itself at
+    startup, so it costs nothing when off. Keep it last in MIDDLEWARE so
+    CSRF and authentication checks run before the profiled view.
+    """
+
+    query_parameter = '__profile'
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        # Imported here so cProfile and pstats are only loaded when profiling is on.
+        from .profiling import profile_call
+
+        self.profile_call = profile_call
+        self.get_response = get_response
+        self.header = 'HTTP_' + getattr(settings, 'PROFILING_HEADER', 'X-Profile').upper().replace('-', '_')
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def wants_profile(self, request):
+        return (
+            (request.META.get(self.header) == '1' or request.GET.get(self.query_parameter) == '1')
+            and request.user.is_staff
+        )
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if asyncio.iscoroutinefunction(view_func) or not self.wants_profile(request):
+            return None
+
+        def call_view():
+            response = view_func(request, *view_args, **view_kwargs)
+            # Admin pages return TemplateResponses; render them while profiling.
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+            return response
+
+        response, duration, summary, collapsed, samples = self.profile_call(call_view)
+        record = ProfileRecord.objects.create(
+            user=request.user,
+            method=request.method,
+            path=request.get_full_path()[:500],
+            view_name=request.resolver_match.view_name if request.resolver_match else '',
+            status_code=response.status_code,
+            duration_ms=duration,
+            sample_count=samples,
+            summary=summary,
+            collapsed=collapsed,
+        )
+        stale = ProfileRecord.objects.values_list('pk', flat=True)[getattr(settings, 'PROFILING_MAX_RECORDS', 200):]
+        ProfileRecord.objects.filter(pk__in=list(stale)).delete()
+        response.headers['X-Profile-Id'] = str(record.pk)
+        return response
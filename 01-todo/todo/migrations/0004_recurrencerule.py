@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0003_todotombstone'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurrenceRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('frequency', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly'), ('monthly', 'Monthly')], max_length=10)),
+                ('interval', models.PositiveSmallIntegerField(default=1)),
+                ('until', models.DateTimeField(blank=True, null=True)),
+                ('count', models.PositiveIntegerField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='todo',
+            name='occurrence_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='todo',
+            name='recurrence_parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='materialized_occurrences', to='todo.todo'),
+        ),
+        migrations.AddConstraint(
+            model_name='todo',
+            constraint=models.UniqueConstraint(fields=('recurrence_parent', 'occurrence_date'), name='todo_unique_occurrence'),
+        ),
+        migrations.AddField(
+            model_name='recurrencerule',
+            name='todo',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='recurrence', to='todo.todo'),
+        ),
+        migrations.AddField(
+            model_name='recurrencerule',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
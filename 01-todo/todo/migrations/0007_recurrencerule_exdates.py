@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0006_workspaces'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recurrencerule',
+            name='exdates',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:49
+
+from django.conf import settings
+from django.db import DatabaseError, migrations, models
+from django.db.models import Max
+
+
+def seed_todo_ids(apps, schema_editor):
+    """Start the database's todo id sequence above the id of every existing todo.
+
+    Todos created before ids were allocated per shard were numbered by each
+    database on its own, so the highest id on any shard counts.
+    """
+    Todo = apps.get_model('todo', 'Todo')
+    TodoIdSequence = apps.get_model('todo', 'TodoIdSequence')
+    alias = schema_editor.connection.alias
+    highest = 0
+    for shard in {alias, *getattr(settings, 'TODO_SHARDS', ['default'])}:
+        try:
+            highest = max(highest, Todo.objects.using(shard).aggregate(highest=Max('id'))['highest'] or 0)
+        except DatabaseError:
+            # A shard that is not migrated yet holds no todos.
+            pass
+    if highest:
+        # See todo.models.MAX_SHARDS.
+        TodoIdSequence.objects.using(alias).create(pk=highest // 1024 + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todo', '0007_recurrencerule_exdates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TodoIdSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+        migrations.RunPython(seed_todo_ids, migrations.RunPython.noop),
+    ]
@@ -1,33 +1,445 @@
-from django.db import models
+from datetime import timedelta
+from django.db import DEFAULT_DB_ALIAS, models, router
+from django.db.models import DEFERRED
 from django.contrib.auth.models import User
+from .recurrence import FREQUENCY_CHOICES, Occurrence, iter_occurrences
+from .routers import get_shards, shard_for_user, shard_number
+from .tenancy import current_workspace
+
+
+class WorkspaceManager(models.Manager):
+    """Manager for workspaces, including each user's personal workspace."""
+    
+    def personal(self, user):
+        """Return the user's personal workspace, creating it on first use."""
+        workspace, created = self.get_or_create(personal_for=user, defaults={'name': user.get_username()})
+        if created:
+            Membership.objects.create(workspace=workspace, user=user, role=Membership.OWNER)
+        return workspace
+
+
+class Workspace(models.Model):
+    """A team's workspace: the tenant that todos and categories belong to."""
+    name = models.CharField(max_length=100)
+    # Set on the workspace every user gets automatically.
+    personal_for = models.OneToOneField(
+        User, on_delete=models.CASCADE, null=True, blank=True, related_name='personal_workspace'
+    )
+    members = models.ManyToManyField(User, through='Membership', related_name='workspaces')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = WorkspaceManager()
+    
+    def __str__(self):
+        return self.name
+
+
+class Membership(models.Model):
+    """A user's membership of a workspace."""
+    OWNER = 'owner'
+    MEMBER = 'member'
+    ROLE_CHOICES = [
+        (OWNER, 'Owner'),
+        (MEMBER, 'Member'),
+    ]
+    
+    workspace = models.ForeignKey(Workspace, on_delete=models.CASCADE, related_name='memberships')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='memberships')
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES, default=MEMBER)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['workspace', 'user'], name='membership_unique_user'),
+        ]
+    
+    def __str__(self):
+        return f'{self.user} in {self.workspace}'
+
+
+class TenantManager(models.Manager):
+    """Manager limited to the rows of the current workspace (see todo.tenancy).
+    
+    Outside of any workspace it returns no rows at all.
+    """
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        workspace = current_workspace()
+        if workspace is None:
+            return queryset.none()
+        return queryset.for_workspace(workspace)
+
+
+class CategoryQuerySet(models.QuerySet):
+    """QuerySet for categories."""
+    
+    def for_workspace(self, workspace):
+        """Return the workspace's categories plus those shared by every workspace."""
+        return self.filter(models.Q(workspace=workspace) | models.Q(workspace__isnull=True))
 
 
 class Category(models.Model):
     """Model to represent a todo category."""
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
+    # Categories without a workspace are shared by all workspaces.
+    workspace = models.ForeignKey(
+        Workspace, on_delete=models.CASCADE, null=True, blank=True, related_name='categories'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = CategoryQuerySet.as_manager()
+    tenant_objects = TenantManager.from_queryset(CategoryQuerySet)()
+    
     class Meta:
         verbose_name_plural = "Categories"
+        indexes = [
+            models.Index(fields=['workspace', 'name'], name='category_workspace_name_idx'),
+        ]
     
     def __str__(self):
         return self.name
 
 
+class ShardedQuerySet(models.QuerySet):
+    """QuerySet for per-user rows that knows which shard holds a user's rows."""
+    
+    def for_user(self, user):
+        """Return the rows of the given user, read from the user's shard."""
+        queryset = self.filter(user=user)
+        alias = shard_for_user(user.pk)
+        if alias != DEFAULT_DB_ALIAS:
+            queryset = queryset.using(alias)
+        return queryset
+    
+    def across_shards(self):
+        """Yield (alias, queryset) pairs covering every shard."""
+        for alias in get_shards():
+            yield alias, self.using(alias)
+    
+    def _on_user_shard(self, values):
+        """Return this queryset on the shard of the user in `values`.
+        
+        A database chosen with using() is kept. Raises ValueError if no
+        user is given and there is more than one shard to choose from.
+        """
+        if self._db is not None:
+            return self
+        user = values.get('user')
+        user_id = values.get('user_id', getattr(user, 'pk', None))
+        if user_id is None:
+            if len(get_shards()) > 1:
+                raise ValueError(f'Cannot choose a shard for a {self.model.__name__} without a user.')
+            return self
+        return self.using(shard_for_user(user_id))
+    
+    def create(self, **kwargs):
+        return super(ShardedQuerySet, self._on_user_shard(kwargs)).create(**kwargs)
+    
+    def get_or_create(self, defaults=None, **kwargs):
+        queryset = self._on_user_shard({**(defaults or {}), **kwargs})
+        return super(ShardedQuerySet, queryset).get_or_create(defaults, **kwargs)
+    
+    def update_or_create(self, defaults=None, create_defaults=None, **kwargs):
+        queryset = self._on_user_shard({**(create_defaults or defaults or {}), **kwargs})
+        return super(ShardedQuerySet, queryset).update_or_create(defaults, create_defaults, **kwargs)
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        """Insert the objects, each on its user's shard unless using() chose one."""
+        objs = list(objs)
+        if self._db is not None:
+            return super().bulk_create(objs, *args, **kwargs)
+        by_shard = {}
+        for obj in objs:
+            queryset = self._on_user_shard({'user_id': obj.user_id})
+            by_shard.setdefault(queryset.db, []).append(obj)
+        for alias, shard_objs in by_shard.items():
+            super(ShardedQuerySet, self.using(alias)).bulk_create(shard_objs, *args, **kwargs)
+        return objs
+
+
+# Todo ids are allocated per shard as sequence * MAX_SHARDS + shard number.
+MAX_SHARDS = 1024
+
+
+def allocate_todo_ids(alias, count=1):
+    """Return `count` new todo ids for rows stored on the given shard.
+    
+    Each database draws from its own TodoIdSequence, in the same transaction
+    as the todos, and the shard's number makes the ids unique across shards,
+    so todos keep their ids when rebalance_shards moves them.
+    """
+    number = shard_number(alias)
+    sequence = TodoIdSequence.objects.using(alias)
+    rows = sequence.bulk_create([TodoIdSequence() for _ in range(count)])
+    # Only the highest value matters; the sequence never hands out a value twice.
+    sequence.filter(pk__lt=rows[-1].pk).delete()
+    return [row.pk * MAX_SHARDS + number for row in rows]
+
+
+class TodoQuerySet(ShardedQuerySet):
+    """QuerySet for todos, including recurring-todo expansion."""
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        """Insert the todos, giving new ones ids from their shard (see allocate_todo_ids)."""
+        objs = list(objs)
+        by_shard = {}
+        for obj in objs:
+            if obj.pk is None:
+                by_shard.setdefault(self._on_user_shard({'user_id': obj.user_id}).db, []).append(obj)
+        for alias, new_objs in by_shard.items():
+            for obj, pk in zip(new_objs, allocate_todo_ids(alias, len(new_objs))):
+                obj.pk = pk
+        return super().bulk_create(objs, *args, **kwargs)
+    
+    def for_workspace(self, workspace):
+        """Return the todos of a workspace.
+        
+        Todos created before workspaces existed have none; they belong to
+        their owner's personal workspace.
+        """
+        scope = models.Q(workspace=workspace)
+        if workspace.personal_for_id is not None:
+            scope |= models.Q(workspace__isnull=True, user_id=workspace.personal_for_id)
+        return self.filter(scope)
+    
+    def occurrences(self, start, end):
+        """Return the not-yet-materialized occurrences in [start, end), by date.
+        
+        The recurring todo itself stands for its first occurrence, and
+        occurrences already stored as rows are skipped, so together with the
+        plain todo list every occurrence is shown exactly once.
+        """
+        series = list(self.filter(recurrence__isnull=False).select_related('recurrence'))
+        if not series:
+            return []
+        materialized = set(
+            Todo.objects.using(self.db)
+            .filter(recurrence_parent__in=series, occurrence_date__gte=start, occurrence_date__lt=end)
+            .values_list('recurrence_parent_id', 'occurrence_date')
+        )
+        occurrences = [
+            Occurrence(todo, when)
+            for todo in series
+            for when in todo.recurrence.between(start, end)
+            if when != todo.recurrence.start and (todo.id, when) not in materialized
+        ]
+        occurrences.sort(key=lambda occurrence: occurrence.when)
+        return occurrences
+
+
 class Todo(models.Model):
     """Model to represent a todo item."""
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True, null=True)
     completed = models.BooleanField(default=False)
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
+    # Todos may live on a different shard than users and categories, so
+    # these references are not enforced by the database.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, db_constraint=False)
+    workspace = models.ForeignKey(
+        Workspace, on_delete=models.CASCADE, null=True, blank=True, db_constraint=False, related_name='todos'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     due_date = models.DateTimeField(blank=True, null=True)
+    # Set on rows materialized from a recurring todo (see materialize_occurrence).
+    recurrence_parent = models.ForeignKey(
+        'self', on_delete=models.CASCADE, null=True, blank=True, related_name='materialized_occurrences'
+    )
+    occurrence_date = models.DateTimeField(blank=True, null=True)
+    
+    objects = TodoQuerySet.as_manager()
+    tenant_objects = TenantManager.from_queryset(TodoQuerySet)()
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Serves the todo list: WHERE workspace = ? AND user = ? ORDER BY created_at DESC
+            models.Index(fields=['workspace', 'user', '-created_at'], name='todo_ws_user_created_idx'),
+            # Serves the delta-sync scan: WHERE user = ? AND (updated_at, id) > (?, ?)
+            models.Index(fields=['user', 'updated_at', 'id'], name='todo_user_updated_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recurrence_parent', 'occurrence_date'],
+                name='todo_unique_occurrence',
+            ),
+        ]
     
     def __str__(self):
         return self.title
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was loaded so save_changes() can tell what changed.
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values) if value is not DEFERRED
+        }
+        return instance
+    
+    def save(self, *args, **kwargs):
+        if self.pk is None:
+            alias = kwargs.get('using') or router.db_for_write(Todo, instance=self)
+            self.pk = allocate_todo_ids(alias)[0]
+            kwargs['force_insert'] = True
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        fields = self._meta.concrete_fields
+        if update_fields is not None:
+            fields = [field for field in fields if field.name in update_fields or field.attname in update_fields]
+        loaded = self.__dict__.setdefault('_loaded_values', {})
+        for field in fields:
+            loaded[field.attname] = getattr(self, field.attname)
+    
+    def changed_fields(self):
+        """Return the names of the fields changed since the row was loaded or saved.
+        
+        Returns None when that is unknown, for rows that were never saved.
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if self._state.adding or loaded is None:
+            return None
+        return [
+            field.name
+            for field in self._meta.concrete_fields
+            if field.attname in loaded and getattr(self, field.attname) != loaded[field.attname]
+        ]
+    
+    def save_changes(self):
+        """Save only the fields that changed, along with updated_at.
+        
+        Nothing is written when no field changed. Returns the names of the
+        changed fields, or None if the whole row had to be saved.
+        """
+        changed = self.changed_fields()
+        if changed is None:
+            self.save()
+        elif changed:
+            self.save(update_fields=[*changed, 'updated_at'])
+        return changed
+    
+    def set_recurrence(self, frequency, interval=None):
+        """Make this todo repeat with the given frequency, or stop repeating if it is empty.
+        
+        An existing rule keeps its interval unless a new one is given.
+        """
+        if not frequency:
+            RecurrenceRule.objects.using(self._state.db).filter(todo=self).delete()
+            return None
+        defaults = {'user_id': self.user_id, 'frequency': frequency}
+        if interval is not None:
+            defaults['interval'] = interval
+        rule, _ = RecurrenceRule.objects.using(self._state.db).update_or_create(todo=self, defaults=defaults)
+        return rule
+    
+    def materialize_occurrence(self, when):
+        """Return the stored row for one occurrence of this recurring todo, creating it if needed.
+        
+        Raises ValueError if `when` is not an occurrence of this todo.
+        """
+        rule = self.recurrence
+        if when == rule.start:
+            return self
+        if not rule.includes(when):
+            raise ValueError(f'{when} is not an occurrence of {self!r}.')
+        occurrence, _ = Todo.objects.using(self._state.db).get_or_create(
+            recurrence_parent=self,
+            occurrence_date=when,
+            defaults={
+                'title': self.title,
+                'description': self.description,
+                'user_id': self.user_id,
+                'category_id': self.category_id,
+                'workspace_id': self.workspace_id,
+                'due_date': when,
+            },
+        )
+        return occurrence
+
+
+class TodoIdSequence(models.Model):
+    """Sequence that todo ids are drawn from, one per database (see allocate_todo_ids)."""
+    
+    def __str__(self):
+        return f'Todo id sequence at {self.pk}'
+
+
+class RecurrenceRule(models.Model):
+    """Rule that repeats a todo; occurrences are expanded lazily."""
+    todo = models.OneToOneField(Todo, on_delete=models.CASCADE, related_name='recurrence')
+    # Denormalized from todo so rules are sharded like the todos they repeat.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES)
+    interval = models.PositiveSmallIntegerField(default=1)
+    until = models.DateTimeField(blank=True, null=True)
+    count = models.PositiveIntegerField(blank=True, null=True)
+    # Timestamps of deleted occurrences; they still count towards `count`.
+    exdates = models.JSONField(default=list, blank=True)
+    
+    objects = ShardedQuerySet.as_manager()
+    
+    def __str__(self):
+        return f'{self.todo} ({self.get_frequency_display().lower()})'
+    
+    @property
+    def start(self):
+        """Return the first occurrence: the todo's due date, else its creation time.
+        
+        Occurrences are identified by whole seconds in URLs, so the start is too.
+        """
+        return (self.todo.due_date or self.todo.created_at).replace(microsecond=0)
+    
+    def between(self, start, end):
+        """Iterate over the occurrences in [start, end), without deleted ones."""
+        excluded = set(self.exdates)
+        return (
+            when
+            for when in iter_occurrences(
+                self.start, self.frequency, self.interval, start, end, until=self.until, count=self.count
+            )
+            if int(when.timestamp()) not in excluded
+        )
+    
+    def includes(self, when):
+        """Return True if `when` is an occurrence of this rule."""
+        return next(self.between(when, when + timedelta(microseconds=1)), None) == when
+
+
+class TodoTombstone(models.Model):
+    """Record of a deleted todo, kept so sync clients can drop their copy."""
+    todo_id = models.BigIntegerField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = ShardedQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at', 'id'], name='tombstone_user_deleted_idx'),
+        ]
+    
+    def __str__(self):
+        return f'Deleted todo {self.todo_id}'
+
+
+class ProfileRecord(models.Model):
+    """Profile of one request, captured on demand by ProfilingMiddleware."""
+    created_at = models.DateTimeField(auto_now_add=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    view_name = models.CharField(max_length=200, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    sample_count = models.PositiveIntegerField(default=0)
+    summary = models.TextField(blank=True)
+    collapsed = models.TextField(blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f'{self.method} {self.path} ({self.duration_ms:.0f} ms)'
@@ -0,0 +1,70 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections, transaction
+from django.utils.functional import cached_property
+
+
+def estimate_count(queryset):
+    """Return the planner's row estimate for an unfiltered queryset, or None.
+
+    Uses pg_class.reltuples on PostgreSQL and the ANALYZE statistics in
+    sqlite_stat1 on SQLite. Filtered querysets and databases without
+    statistics return None.
+    """
+    query = queryset.query
+    if query.where or query.distinct or query.combinator or query.is_sliced:
+        return None
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    try:
+        with transaction.atomic(using=queryset.db), connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+                row = cursor.fetchone()
+                return row[0] if row and row[0] >= 0 else None
+            if connection.vendor == 'sqlite':
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+                row = cursor.fetchone()
+                return int(row[0].split()[0]) if row else None
+    except DatabaseError:
+        # No statistics table yet (ANALYZE has never run).
+        return None
+    return None
+
+
+def fast_count(queryset):
+    """Return a cheap row count for a queryset.
+
+    Big unfiltered tables report the planner estimate; everything else is
+    counted exactly. Either way the result is cached for
+    ADMIN_COUNT_CACHE_SECONDS, so repeated changelist loads skip both.
+    """
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    digest = hashlib.md5(f'{queryset.db}:{sql}:{params}'.encode(), usedforsecurity=False).hexdigest()
+    key = f'todo:count:{digest}'
+    count = cache.get(key)
+    if count is None:
+        count = estimate_count(queryset)
+        if count is None or count < getattr(settings, 'ADMIN_ESTIMATE_COUNT_THRESHOLD', 100000):
+            count = queryset.count()
+        cache.set(key, count, getattr(settings, 'ADMIN_COUNT_CACHE_SECONDS', 60))
+    return count
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that avoids a full COUNT(*) on every changelist load.
+
+    Page links past the real end of the data simply come back empty, which
+    is the usual trade-off for estimated counts.
+    """
+
+    @cached_property
+    def count(self):
+        return fast_count(self.object_list)
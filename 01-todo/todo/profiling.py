@@ -0,0 +1,93 @@
+"""On-demand request profiling.
+
+profile_call() runs a callable under cProfile (for the per-function
+summary) while a background thread samples the calling thread's stack (for
+flamegraphs). Stacks are written in the "collapsed" format understood by
+flamegraph.pl, speedscope and inferno: one ``root;...;leaf count`` line per
+distinct stack.
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+_PATH_PREFIXES = sorted(
+    {
+        os.path.join(str(settings.BASE_DIR), ''),
+        os.path.join(sysconfig.get_paths()['purelib'], ''),
+        os.path.join(sysconfig.get_paths()['stdlib'], ''),
+    },
+    key=len,
+    reverse=True,
+)
+
+
+def frame_label(code):
+    """Return a short, stable label for a code object."""
+    filename = code.co_filename
+    for prefix in _PATH_PREFIXES:
+        if filename.startswith(prefix):
+            filename = filename[len(prefix):]
+            break
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'
+
+
+class StackSampler(threading.Thread):
+    """Sample another thread's Python stack at a fixed interval.
+
+    Only frames above stop_code are recorded; samples taken while the thread
+    is not inside stop_code are dropped.
+    """
+
+    def __init__(self, thread_id, interval, stop_code):
+        super().__init__(name='todo-profiler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stop_code = stop_code
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None and frame.f_code is not self.stop_code:
+                labels.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if frame is not None and labels:
+                self.stacks[';'.join(reversed(labels))] += 1
+
+    def collapsed(self):
+        """Return the samples in collapsed-stack format."""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def profile_call(func, *args, **kwargs):
+    """Call func under the profilers.
+
+    Returns (result, duration in ms, pstats summary, collapsed stacks,
+    sample count). Exceptions from func propagate after profiling stops.
+    """
+    interval = getattr(settings, 'PROFILING_SAMPLE_INTERVAL', 0.001)
+    sampler = StackSampler(threading.get_ident(), interval, cProfile.Profile.runcall.__code__)
+    profiler = cProfile.Profile()
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        result = profiler.runcall(func, *args, **kwargs)
+    finally:
+        duration = (time.perf_counter() - start) * 1000
+        sampler.stopped.set()
+        sampler.join()
+
+    summary = io.StringIO()
+    stats = pstats.Stats(profiler, stream=summary)
+    stats.sort_stats('cumulative').print_stats(getattr(settings, 'PROFILING_SUMMARY_LINES', 40))
+    return result, duration, summary.getvalue(), sampler.collapsed(), sum(sampler.stacks.values())
@@ -0,0 +1,94 @@
+"""Lazy expansion of recurring todos.
+
+A recurring todo is stored once, with a RecurrenceRule. Its occurrences are
+computed on the fly for whatever window is being displayed; only the ones a
+user completes or edits are written to the database (see
+Todo.materialize_occurrence). iter_occurrences() jumps straight to the
+first occurrence inside the window, so expanding a rule costs the same
+whether it started last week or ten years ago.
+"""
+import calendar
+from datetime import timedelta
+
+DAILY = 'daily'
+WEEKLY = 'weekly'
+MONTHLY = 'monthly'
+
+FREQUENCY_CHOICES = [
+    (DAILY, 'Daily'),
+    (WEEKLY, 'Weekly'),
+    (MONTHLY, 'Monthly'),
+]
+
+
+def _add_months(moment, months):
+    """Return moment shifted by whole months, or None if that day does not exist."""
+    month_index = moment.month - 1 + months
+    year, month = moment.year + month_index // 12, month_index % 12 + 1
+    if moment.day > calendar.monthrange(year, month)[1]:
+        return None
+    return moment.replace(year=year, month=month)
+
+
+def iter_occurrences(start, frequency, interval, window_start, window_end, until=None, count=None):
+    """Yield the occurrences of a rule that fall in [window_start, window_end).
+
+    `start` is the first occurrence; `until` (inclusive) and `count` bound
+    the series. Monthly rules skip months without the start's day of month,
+    as RFC 5545 does.
+    """
+    interval = max(1, interval)
+    if until is not None:
+        window_end = min(window_end, until + timedelta(microseconds=1))
+
+    if frequency in (DAILY, WEEKLY):
+        step = timedelta(days=interval * (7 if frequency == WEEKLY else 1))
+        index = max(0, -(-(window_start - start) // step))  # ceiling division
+        moment = start + index * step
+        while moment < window_end and (count is None or index < count):
+            yield moment
+            index += 1
+            moment += step
+        return
+
+    if frequency == MONTHLY:
+        if count is None:
+            months_before = (window_start.year - start.year) * 12 + window_start.month - start.month
+            index = max(0, months_before // interval - 1)
+        else:
+            # Skipped months do not use up the count, so a counted series
+            # is walked from its start.
+            index = 0
+        seen = 0
+        while count is None or seen < count:
+            moment = _add_months(start, index * interval)
+            index += 1
+            if moment is None:
+                continue
+            seen += 1
+            if moment >= window_end:
+                return
+            if moment >= window_start:
+                yield moment
+        return
+
+    raise ValueError(f'Unknown recurrence frequency: {frequency!r}')
+
+
+class Occurrence:
+    """An occurrence of a recurring todo that has not been materialized."""
+
+    completed = False
+
+    def __init__(self, todo, when):
+        self.todo = todo
+        self.when = when
+
+    @property
+    def key(self):
+        """Return the integer timestamp identifying this occurrence in URLs."""
+        return int(self.when.timestamp())
+
+    def __getattr__(self, name):
+        # Everything else (title, category, ...) comes from the recurring todo.
+        return getattr(self.todo, name)
@@ -0,0 +1,107 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS
+
+
+# Set by ReplicaPinningMiddleware for the duration of a request. While True,
+# every read is sent to the primary so a user always sees their own writes.
+_pinned_to_primary = ContextVar('pinned_to_primary', default=False)
+
+
+def pin_to_primary(pinned=True):
+    """Pin reads in the current context to the primary database."""
+    return _pinned_to_primary.set(pinned)
+
+
+def unpin(token):
+    """Restore the pinning state saved by pin_to_primary()."""
+    _pinned_to_primary.reset(token)
+
+
+def is_pinned():
+    """Return True if reads in the current context must use the primary."""
+    return _pinned_to_primary.get()
+
+
+def get_shards():
+    """Return the database aliases todos are sharded across."""
+    return list(getattr(settings, 'TODO_SHARDS', [DEFAULT_DB_ALIAS]))
+
+
+def shard_for_user(user_id):
+    """Return the database alias holding the todos of the given user."""
+    shards = get_shards()
+    return shards[user_id % len(shards)]
+
+
+def shard_number(alias):
+    """Return the number of a shard, which ends the ids of the todos created there."""
+    numbers = getattr(settings, 'TODO_SHARD_NUMBERS', {DEFAULT_DB_ALIAS: 0})
+    try:
+        return numbers[alias]
+    except KeyError:
+        raise ImproperlyConfigured(f'TODO_SHARD_NUMBERS has no number for the {alias!r} database.')
+
+
+def get_replicas():
+    """Return the configured read-replica aliases."""
+    return list(getattr(settings, 'REPLICA_DATABASES', []))
+
+
+class UserShardRouter:
+    """Send sharded models to the shard owning the row's user.
+
+    Only queries that carry an instance hint (saves, deletes, related
+    lookups from a loaded row) can be routed here; list queries pick their
+    shard explicitly through ShardedQuerySet.for_user(). Anything this router
+    cannot place falls through to the next router.
+    """
+
+    sharded_models = {'todo.todo', 'todo.recurrencerule', 'todo.todotombstone'}
+
+    def _shard(self, model, hints):
+        if model._meta.label_lower not in self.sharded_models:
+            return None
+        user_id = getattr(hints.get('instance'), 'user_id', None)
+        if user_id is None:
+            return None
+        return shard_for_user(user_id)
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard(model, hints)
+
+
+class PrimaryReplicaRouter:
+    """Send writes to the primary and reads to a read replica.
+
+    Reads fall back to the primary when no replica is configured, when the
+    current request is pinned (see ReplicaPinningMiddleware) and for
+    sessions, which must never be served stale.
+    """
+
+    primary = DEFAULT_DB_ALIAS
+    primary_only_apps = {'sessions'}
+
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if not replicas or is_pinned() or model._meta.app_label in self.primary_only_apps:
+            return self.primary
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return self.primary
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The primary and its replicas hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are migrated too so a local SQLite copy can stand in for
+        # a real replica: `manage.py migrate --database replica`.
+        return True
@@ -0,0 +1,116 @@
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Category, RecurrenceRule, Todo, TodoTombstone, Workspace
+from .routers import get_shards
+from .tenancy import invalidate_tenant_cache
+from .user_cache import user_cache_key
+
+
+@receiver(pre_delete, sender=User)
+def delete_sharded_todos(sender, instance, using, **kwargs):
+    """Delete a user's todos on shards the deletion collector cannot see."""
+    for alias in get_shards():
+        if alias != using:
+            Todo.objects.using(alias).filter(user_id=instance.pk).delete()
+            TodoTombstone.objects.using(alias).filter(user_id=instance.pk).delete()
+
+
+@receiver(pre_delete, sender=Workspace)
+def delete_sharded_workspace_todos(sender, instance, using, **kwargs):
+    """Delete a workspace's todos on shards the deletion collector cannot see."""
+    for alias in get_shards():
+        if alias != using:
+            Todo.objects.using(alias).filter(workspace_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_workspace_categories(sender, instance, **kwargs):
+    """Drop the cached category list of the category's workspace, or of all of them."""
+    invalidate_tenant_cache(instance.workspace_id)
+
+
+@receiver(pre_delete, sender=Category)
+def clear_sharded_categories(sender, instance, using, **kwargs):
+    """Unset a deleted category on todos stored on other shards.
+    
+    The affected todos also get a fresh updated_at, which neither
+    QuerySet.update() nor on_delete=SET_NULL would set, so sync clients
+    pick up the change.
+    """
+    now = timezone.now()
+    for alias in get_shards():
+        todos = Todo.objects.using(alias).filter(category_id=instance.pk)
+        if alias == using:
+            todos.update(updated_at=now)
+        else:
+            todos.update(category=None, updated_at=now)
+
+
+@receiver(post_delete, sender=Todo)
+def record_tombstone(sender, instance, using, origin=None, **kwargs):
+    """Leave a tombstone next to every deleted todo for sync clients.
+    
+    Not when the todo goes because its user is deleted: nobody is left to
+    sync it, and the tombstone would never be pruned for that user.
+    """
+    if isinstance(origin, User) or getattr(origin, 'model', None) is User:
+        return
+    TodoTombstone.objects.using(using).create(todo_id=instance.pk, user_id=instance.user_id)
+
+
+@receiver(post_delete, sender=Todo)
+def exclude_deleted_occurrence(sender, instance, using, **kwargs):
+    """Keep a deleted occurrence of a recurring todo from being listed again.
+    
+    The stored row is what hides an occurrence from the expansion, so its
+    date is added to the rule's exclusions when the row goes away.
+    """
+    if instance.recurrence_parent_id is None:
+        return
+    rule = RecurrenceRule.objects.using(using).filter(todo_id=instance.recurrence_parent_id).first()
+    timestamp = int(instance.occurrence_date.timestamp())
+    if rule is not None and timestamp not in rule.exdates:
+        rule.exdates.append(timestamp)
+        rule.save(update_fields=['exdates'])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Drop the cached copy of a user whenever the user row changes."""
+    cache.delete(user_cache_key(instance.pk))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_cached_user_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    """Drop cached users whose groups or direct permissions changed."""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        user_ids = [instance.pk]
+    elif action == 'pre_clear':
+        user_ids = instance.user_set.values_list('pk', flat=True)
+    else:
+        user_ids = pk_set
+    cache.delete_many([user_cache_key(user_id) for user_id in user_ids])
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_cached_group_members(sender, instance, action, reverse, pk_set, **kwargs):
+    """Drop cached users belonging to groups whose permissions changed."""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        group_ids = [instance.pk]
+    elif action == 'pre_clear':
+        group_ids = instance.group_set.values_list('pk', flat=True)
+    else:
+        group_ids = pk_set
+    user_ids = User.objects.filter(groups__in=group_ids).values_list('pk', flat=True)
+    cache.delete_many([user_cache_key(user_id) for user_id in user_ids])
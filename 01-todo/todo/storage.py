@@ -0,0 +1,42 @@
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+from .compression import available_encodings, compress
+
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage that also writes pre-compressed copies.
+
+    Every hashed text asset gets a .gz (and, with brotli installed, a .br)
+    sibling at collectstatic time, so serve_static() never compresses on
+    the request path.
+    """
+    compressible_extensions = ('.css', '.js', '.svg', '.txt', '.json', '.html')
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed_names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names.add(hashed_name)
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for hashed_name in sorted(hashed_names):
+            if hashed_name.endswith(self.compressible_extensions):
+                self.write_compressed(hashed_name)
+
+    def write_compressed(self, name):
+        """Write compressed siblings of a stored file when they are smaller."""
+        path = self.path(name)
+        with open(path, 'rb') as original:
+            data = original.read()
+        for encoding in available_encodings():
+            compressed = compress(data, encoding, static=True)
+            if len(compressed) < len(data):
+                with open(path + ENCODING_SUFFIXES[encoding], 'wb') as target:
+                    target.write(compressed)
+            elif os.path.exists(path + ENCODING_SUFFIXES[encoding]):
+                os.remove(path + ENCODING_SUFFIXES[encoding])
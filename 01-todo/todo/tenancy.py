@@ -0,0 +1,103 @@
+"""The current workspace (tenant) and per-workspace cache namespaces.
+
+WorkspaceMiddleware activates a resolver for the request's workspace; the
+workspace itself is looked up at most once, the first time something asks
+for it. Code running outside a request (commands, tests, the shell) can
+scope itself with use_workspace().
+
+Cached values are keyed under a namespace per workspace. Invalidating a
+workspace moves it to a fresh namespace, so other workspaces keep their
+entries; the stale ones simply expire. Values built from rows shared by
+every workspace (workspace=None) also depend on a shared namespace.
+Nothing is cached unless the cache is shared by every worker process:
+invalidation could not reach the other workers otherwise.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+_current_workspace = ContextVar('todo_current_workspace', default=None)
+
+SHARED = 'shared'
+
+# Backends whose entries are private to one process.
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def activate(resolver):
+    """Make `resolver()` the current workspace; returns a token for deactivate()."""
+    return _current_workspace.set(resolver)
+
+
+def deactivate(token):
+    """Restore the workspace that was current before activate()."""
+    _current_workspace.reset(token)
+
+
+def current_workspace():
+    """Return the active workspace, or None outside of any workspace."""
+    resolver = _current_workspace.get()
+    return resolver() if resolver is not None else None
+
+
+@contextmanager
+def use_workspace(workspace):
+    """Make `workspace` the current workspace for the duration of the block."""
+    token = activate(lambda: workspace)
+    try:
+        yield workspace
+    finally:
+        deactivate(token)
+
+
+def cache_is_shared():
+    """Return True if the default cache is shared by every worker process."""
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], PROCESS_LOCAL_BACKENDS)
+
+
+def _version_key(workspace_id):
+    return f'todo:ws-version:{SHARED if workspace_id is None else workspace_id}'
+
+
+def _versions(workspace_id):
+    keys = [_version_key(workspace_id), _version_key(None)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Start from the clock rather than 0, so a version evicted from
+            # the cache never brings back entries from an older namespace.
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def tenant_cache_key(workspace_id, key):
+    """Return the cache key for `key` in the workspace's current namespace."""
+    version, shared_version = _versions(workspace_id)
+    return f'todo:ws:{workspace_id}:{version}:{shared_version}:{key}'
+
+
+def tenant_cache_get_or_set(workspace_id, key, default, timeout=None):
+    """Return the workspace's cached value for `key`, computing it with default() on a miss.
+
+    With a process-local cache the value is computed every time.
+    """
+    if not cache_is_shared():
+        return default()
+    if timeout is None:
+        timeout = getattr(settings, 'TENANT_CACHE_TIMEOUT', 300)
+    return cache.get_or_set(tenant_cache_key(workspace_id, key), default, timeout)
+
+
+def invalidate_tenant_cache(workspace_id):
+    """Drop everything cached for one workspace, or for all of them if workspace_id is None."""
+    key = _version_key(workspace_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.db import connections
+from django.test.runner import DiscoverRunner
+
+
+class ShardedTestRunner(DiscoverRunner):
+    """Test runner that adds the second shard MultiShardTests routes todos to.
+
+    Only the test database is created for it; TODO_SHARDS is left alone, so
+    other tests keep using a single shard.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        if 'shard1' not in settings.DATABASES:
+            settings.DATABASES['shard1'] = {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': settings.BASE_DIR / 'shard1.sqlite3',
+            }
+            # connections shares this dict; fill in the defaults for the new alias.
+            connections.configure_settings(settings.DATABASES)
@@ -1,8 +1,56 @@
-from django.test import TestCase, Client
-from django.contrib.auth.models import User
+import asyncio
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import traceback
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+from asgiref.sync import ThreadSensitiveContext
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection, connections
+from django.test.utils import CaptureQueriesContext
+from django.test import LiveServerTestCase, TestCase, TransactionTestCase, Client, RequestFactory, override_settings
+from django.contrib.auth.models import Permission, User
+from django.contrib.sessions.backends.cache import SessionStore
+from django.contrib.sessions.models import Session
+from django.http import Http404, HttpResponse
 from django.urls import reverse
-from datetime import datetime, timedelta
-from .models import Todo, Category
+from django.utils import timezone
+from datetime import datetime, timedelta, timezone as dt_timezone
+from .models import MAX_SHARDS, Todo, Category, Membership, ProfileRecord, RecurrenceRule, TodoTombstone, Workspace
+from .recurrence import DAILY, MONTHLY, WEEKLY, iter_occurrences
+from .compression import choose_encoding
+from .loadtest import HISTOGRAM_BUCKETS, Stats, count_tracebacks, run_load
+from .paginator import EstimatedCountPaginator, estimate_count
+from .middleware import CompressionMiddleware, ProfilingMiddleware, ReplicaPinningMiddleware, get_workspace
+from .routers import PrimaryReplicaRouter, UserShardRouter, is_pinned, shard_for_user
+from .tenancy import invalidate_tenant_cache, tenant_cache_get_or_set, tenant_cache_key, use_workspace
+from .user_cache import user_cache_key
+from .views import serve_static, url_template
+
+
+def use_shared_cache(test_case, **extra_settings):
+    """Point the default cache at a file-based cache, which worker processes share, for one test."""
+    cache_dir = tempfile.TemporaryDirectory()
+    test_case.addCleanup(cache_dir.cleanup)
+    shared_cache = override_settings(
+        CACHES={
+            'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': cache_dir.name,
+            },
+        },
+        **extra_settings,
+    )
+    shared_cache.enable()
+    test_case.addCleanup(shared_cache.disable)
 
 
 class TodoModelTests(TestCase):
@@ -268,7 +316,8 @@ class CategoryViewTests(TestCase):
         )
         self.category = Category.objects.create(
             name='Work',
-            description='Work tasks'
+            description='Work tasks',
+            workspace=Workspace.objects.personal(self.user)
         )
     
     def test_category_list_requires_login(self):
@@ -321,6 +370,20 @@ class CategoryViewTests(TestCase):
         self.assertEqual(response.status_code, 302)
         with self.assertRaises(Category.DoesNotExist):
             Category.objects.get(id=category_id)
+    
+    def test_shared_categories_are_read_only(self):
+        """Test that categories shared by every workspace cannot be changed or deleted."""
+        shared = Category.objects.create(name='Shared')
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(reverse('category_list'))
+        self.assertIn(shared, response.context['categories'])
+        self.assertNotContains(response, reverse('update_category', args=[shared.id]))
+        
+        response = self.client.post(reverse('update_category', args=[shared.id]), {'name': 'Mine'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.post(reverse('delete_category', args=[shared.id])).status_code, 404)
+        shared.refresh_from_db()
+        self.assertEqual(shared.name, 'Shared')
 
 
 class FormValidationTests(TestCase):
@@ -385,7 +448,7 @@ class EdgeCaseTests(TestCase):
     
     def test_delete_category_with_assigned_todos(self):
         """Test deleting a category that has assigned todos."""
-        category = Category.objects.create(name='Work')
+        category = Category.objects.create(name='Work', workspace=Workspace.objects.personal(self.user))
         todo = Todo.objects.create(
             title='Task',
             user=self.user,
@@ -397,3 +460,1155 @@ class EdgeCaseTests(TestCase):
         
         todo.refresh_from_db()
         self.assertIsNone(todo.category)  # Category should be set to NULL
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+class ReplicaRoutingTests(TestCase):
+    """Test cases for read-replica routing and primary pinning."""
+    
+    def setUp(self):
+        """Set up the router and a middleware that records pinning."""
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+        self.seen_pinned = None
+        
+        def view(request):
+            self.seen_pinned = is_pinned()
+            return HttpResponse()
+        
+        self.middleware = ReplicaPinningMiddleware(view)
+    
+    def test_reads_go_to_replica(self):
+        """Test that reads are routed to the replica."""
+        self.assertEqual(self.router.db_for_read(Todo), 'replica')
+        self.assertEqual(self.router.db_for_write(Todo), 'default')
+    
+    @override_settings(REPLICA_DATABASES=[])
+    def test_reads_use_primary_without_replicas(self):
+        """Test that reads fall back to the primary when no replica exists."""
+        self.assertEqual(self.router.db_for_read(Todo), 'default')
+    
+    def test_sessions_always_read_from_primary(self):
+        """Test that session reads are never routed to a replica."""
+        self.assertEqual(self.router.db_for_read(Session), 'default')
+    
+    def test_write_request_pins_and_sets_cookie(self):
+        """Test that a POST is served from the primary and pins the client."""
+        response = self.middleware(self.factory.post('/todos/create/'))
+        self.assertTrue(self.seen_pinned)
+        self.assertIn('primary_pin', response.cookies)
+        self.assertFalse(is_pinned())
+    
+    def test_read_after_write_is_pinned(self):
+        """Test that reads inside the pin window use the primary."""
+        request = self.factory.get('/todos/')
+        request.COOKIES['primary_pin'] = str(time.time() + 5)
+        self.middleware(request)
+        self.assertTrue(self.seen_pinned)
+    
+    def test_read_after_pin_expiry_uses_replica(self):
+        """Test that reads after the pin window are not pinned."""
+        request = self.factory.get('/todos/')
+        request.COOKIES['primary_pin'] = str(time.time() - 1)
+        response = self.middleware(request)
+        self.assertFalse(self.seen_pinned)
+        self.assertNotIn('primary_pin', response.cookies)
+
+
+class ShardingTests(TestCase):
+    """Test cases for user-based sharding of todos."""
+    
+    def setUp(self):
+        """Set up test data."""
+        self.router = UserShardRouter()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+    
+    @override_settings(TODO_SHARDS=['default', 'shard1'])
+    def test_users_map_to_shards(self):
+        """Test that user ids are spread over the configured shards."""
+        self.assertEqual(shard_for_user(2), 'default')
+        self.assertEqual(shard_for_user(3), 'shard1')
+    
+    @override_settings(TODO_SHARDS=['default', 'shard1'])
+    def test_router_uses_instance_user(self):
+        """Test that todo writes are routed to the owner's shard."""
+        todo = Todo(title='Task', user_id=3)
+        self.assertEqual(self.router.db_for_write(Todo, instance=todo), 'shard1')
+        self.assertIsNone(self.router.db_for_write(Category, instance=todo))
+        self.assertIsNone(self.router.db_for_read(Todo))
+    
+    @override_settings(TODO_SHARDS=['shard1', 'shard2'])
+    def test_for_user_reads_from_user_shard(self):
+        """Test that for_user() pins the queryset to the user's shard."""
+        expected = shard_for_user(self.user.pk)
+        self.assertEqual(Todo.objects.for_user(self.user).db, expected)
+    
+    def test_single_shard_uses_default_routing(self):
+        """Test that for_user() leaves routing alone with a single shard."""
+        todo = Todo.objects.create(title='Task', user=self.user)
+        self.assertEqual(list(Todo.objects.for_user(self.user)), [todo])
+    
+    def test_rebalance_with_single_shard_moves_nothing(self):
+        """Test that rebalancing a single shard is a no-op."""
+        Todo.objects.create(title='Task', user=self.user)
+        out = StringIO()
+        call_command('rebalance_shards', stdout=out)
+        self.assertIn('Moved 0 todo(s) for 0 user(s).', out.getvalue())
+        self.assertEqual(Todo.objects.count(), 1)
+
+
+@override_settings(TODO_SHARDS=['default', 'shard1'], TODO_SHARD_NUMBERS={'default': 0, 'shard1': 1})
+class MultiShardTests(TestCase):
+    """Test cases for sharding against a second database."""
+    databases = {'default', 'shard1'}
+    
+    def setUp(self):
+        """Set up one user per shard."""
+        users = [User.objects.create_user(username=f'user{n}', password='testpass123') for n in range(2)]
+        self.local_user, self.remote_user = sorted(users, key=lambda user: shard_for_user(user.pk) == 'shard1')
+        self.assertEqual(shard_for_user(self.remote_user.pk), 'shard1')
+    
+    def test_todos_are_written_to_and_read_from_user_shard(self):
+        """Test that saves and for_user() reads use the owner's shard."""
+        todo = Todo(title='Remote', user=self.remote_user)
+        todo.save()
+        self.assertTrue(Todo.objects.using('shard1').filter(pk=todo.pk).exists())
+        self.assertFalse(Todo.objects.using('default').filter(pk=todo.pk).exists())
+        self.assertEqual(list(Todo.objects.for_user(self.remote_user)), [todo])
+    
+    def test_queryset_creates_on_user_shard(self):
+        """Test that create(), get_or_create() and bulk_create() pick the user's shard."""
+        created = Todo.objects.create(title='Created', user=self.remote_user)
+        fetched, was_created = Todo.objects.get_or_create(title='Fetched', defaults={'user_id': self.remote_user.pk})
+        self.assertTrue(was_created)
+        Todo.objects.bulk_create([
+            Todo(title='Bulk remote', user=self.remote_user),
+            Todo(title='Bulk local', user=self.local_user),
+        ])
+        RecurrenceRule.objects.create(todo=created, user=self.remote_user, frequency=DAILY)
+        
+        self.assertEqual(
+            set(Todo.objects.using('shard1').values_list('title', flat=True)),
+            {'Created', 'Fetched', 'Bulk remote'},
+        )
+        self.assertEqual(list(Todo.objects.using('default').values_list('title', flat=True)), ['Bulk local'])
+        self.assertTrue(RecurrenceRule.objects.using('shard1').filter(todo_id=created.pk).exists())
+        with self.assertRaises(ValueError):
+            Todo.objects.get_or_create(title='Nobody')
+    
+    def test_rebalance_moves_todos_keeping_ids(self):
+        """Test that rebalancing moves todos, rules and tombstones to the user's shard."""
+        todo = Todo.objects.using('default').create(pk=500, title='Misplaced', user=self.remote_user)
+        RecurrenceRule.objects.using('default').create(todo=todo, user=self.remote_user, frequency=DAILY)
+        TodoTombstone.objects.using('default').create(todo_id=499, user=self.remote_user)
+        call_command('rebalance_shards', stdout=StringIO())
+        
+        moved = Todo.objects.using('shard1').get(pk=500)
+        self.assertEqual((moved.title, moved.created_at), ('Misplaced', todo.created_at))
+        self.assertTrue(RecurrenceRule.objects.using('shard1').filter(todo_id=500).exists())
+        self.assertEqual(list(TodoTombstone.objects.using('shard1').values_list('todo_id', flat=True)), [499])
+        self.assertFalse(Todo.objects.using('default').filter(user=self.remote_user).exists())
+        self.assertFalse(TodoTombstone.objects.using('default').filter(user=self.remote_user).exists())
+    
+    def test_todo_ids_stay_unique_over_repeated_rebalancing(self):
+        """Test that todos created on different shards can be moved back and forth."""
+        def create_todos(label):
+            for user in (self.local_user, self.remote_user):
+                Todo(title=f'{label} saved', user=user).save()
+                Todo.objects.create(title=f'{label} created', user=user)
+        
+        create_todos('First')
+        with override_settings(TODO_SHARDS=['shard1', 'default']):
+            call_command('rebalance_shards', stdout=StringIO())
+            create_todos('Second')
+        call_command('rebalance_shards', stdout=StringIO())
+        
+        for user in (self.local_user, self.remote_user):
+            titles = Todo.objects.for_user(user).values_list('title', flat=True)
+            self.assertEqual(len(titles), 4)
+        ids = [pk for _, todos in Todo.objects.across_shards() for pk in todos.values_list('pk', flat=True)]
+        self.assertEqual(len(set(ids)), 8)
+        self.assertEqual({pk % MAX_SHARDS for pk in ids}, {0, 1})
+    
+    def test_rebalance_finishes_interrupted_move(self):
+        """Test that rows left on the source after a committed copy are moved once."""
+        Todo.objects.using('default').create(pk=500, title='Misplaced', user=self.remote_user)
+        call_command('rebalance_shards', stdout=StringIO())
+        # As if the source delete had failed after the copy was committed.
+        leftover = Todo.objects.using('shard1').get(pk=500)
+        created_at = leftover.created_at
+        Todo.objects.using('default').bulk_create([leftover])
+        Todo.objects.using('default').filter(pk=500).update(created_at=created_at)
+        call_command('rebalance_shards', stdout=StringIO())
+        self.assertEqual(Todo.objects.using('shard1').filter(pk=500).count(), 1)
+        self.assertFalse(Todo.objects.using('default').exists())
+    
+    def test_rebalance_refuses_to_renumber_todos(self):
+        """Test that an id already used on the target stops the move."""
+        other = User.objects.create_user(username='other', password='testpass123')
+        Todo.objects.using('shard1').create(pk=500, title='Taken', user=other)
+        Todo.objects.using('default').create(pk=500, title='Misplaced', user=self.remote_user)
+        with self.assertRaisesMessage(CommandError, 'todo id(s) 500 are taken on shard1'):
+            call_command('rebalance_shards', stdout=StringIO())
+        self.assertEqual(Todo.objects.using('default').get(pk=500).title, 'Misplaced')
+        self.assertEqual(Todo.objects.using('shard1').get(pk=500).title, 'Taken')
+    
+    def test_admin_lists_todos_of_other_shard(self):
+        """Test that the admin shard filter renders rows whose users live on another database."""
+        self.remote_user.is_staff = self.remote_user.is_superuser = True
+        self.remote_user.save()
+        category = Category.objects.create(name='Work')
+        for n in range(3):
+            Todo(title=f'Remote {n}', user=self.remote_user, category=category).save()
+        self.client.force_login(self.remote_user)
+        
+        with CaptureQueriesContext(connections['default']) as captured:
+            response = self.client.get(reverse('admin:todo_todo_changelist'), {'shard': 'shard1'})
+        self.assertEqual(len(response.context['cl'].result_list), 3)
+        # One query for the logged-in user and one prefetching the rows' users.
+        user_queries = [q for q in captured if 'FROM "auth_user"' in q['sql']]
+        self.assertEqual(len(user_queries), 2)
+        self.assertContains(response, 'Remote 0')
+        self.assertContains(response, 'Work')
+    
+    def test_admin_edits_recurrence_rule_on_todo_shard(self):
+        """Test that the recurrence inline reads and writes the rule on the todo's shard."""
+        self.remote_user.is_staff = self.remote_user.is_superuser = True
+        self.remote_user.save()
+        todo = Todo(title='Remote standup', user=self.remote_user)
+        todo.save()
+        rule = todo.set_recurrence(DAILY)
+        self.client.force_login(self.remote_user)
+        url = reverse('admin:todo_todo_change', args=[todo.pk]) + '?shard=shard1'
+        
+        response = self.client.get(url)
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertEqual([form.instance for form in formset.initial_forms], [rule])
+        
+        response = self.client.post(url, {
+            'title': 'Remote standup',
+            'description': '',
+            'user': self.remote_user.pk,
+            'recurrence-TOTAL_FORMS': '1',
+            'recurrence-INITIAL_FORMS': '1',
+            'recurrence-MIN_NUM_FORMS': '0',
+            'recurrence-MAX_NUM_FORMS': '1',
+            'recurrence-0-id': rule.pk,
+            'recurrence-0-todo': todo.pk,
+            'recurrence-0-frequency': WEEKLY,
+            'recurrence-0-interval': '2',
+        })
+        self.assertEqual(response.status_code, 302)
+        rule = RecurrenceRule.objects.using('shard1').get(todo_id=todo.pk)
+        self.assertEqual((rule.frequency, rule.interval), (WEEKLY, 2))
+        self.assertFalse(RecurrenceRule.objects.using('default').exists())
+
+
+class CachedAuthTests(TestCase):
+    """Test cases for the cached session and user fast path."""
+    
+    def setUp(self):
+        """Set up a logged-in client with a warm, shared user cache."""
+        use_shared_cache(self, SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client = Client()
+        self.client.login(username='testuser', password='testpass123')
+        self.client.get(reverse('todo_list'))
+    
+    def test_user_is_served_from_cache(self):
+        """Test that a warm request does not query the session or user tables."""
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('todo_list'))
+        self.assertEqual(response.context['user'], self.user)
+        tables = ' '.join(query['sql'] for query in captured)
+        self.assertNotIn('auth_user', tables)
+        self.assertNotIn('django_session', tables)
+    
+    def test_password_change_invalidates_cache(self):
+        """Test that changing the password logs the cached session out."""
+        self.assertIsNotNone(cache.get(user_cache_key(self.user.pk)))
+        self.user.set_password('newpass456')
+        self.user.save()
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+        response = self.client.get(reverse('todo_list'))
+        self.assertEqual(response.status_code, 302)
+    
+    def test_permission_change_invalidates_cache(self):
+        """Test that granting a permission drops the cached user."""
+        permission = Permission.objects.get(codename='add_todo')
+        self.user.user_permissions.add(permission)
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+    
+    def test_process_local_cache_skips_user_cache(self):
+        """Test that users are not cached where other workers could not invalidate them."""
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            with CaptureQueriesContext(connection) as captured:
+                self.client.get(reverse('todo_list'))
+            self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+        self.assertIn('auth_user', ' '.join(query['sql'] for query in captured))
+
+
+class DeliveryTests(TestCase):
+    """Test cases for response compression and static file caching."""
+    
+    def setUp(self):
+        """Set up a request factory and a temporary static root."""
+        self.factory = RequestFactory()
+        self.static_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.static_root.cleanup)
+    
+    def compress_view(self, body, content_type='text/html'):
+        """Return CompressionMiddleware wrapping a view that returns body."""
+        return CompressionMiddleware(lambda request: HttpResponse(body, content_type=content_type))
+    
+    def test_large_html_is_gzipped(self):
+        """Test that large text responses are compressed."""
+        body = '<tr><td>Todo</td></tr>' * 500
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip')
+        response = self.compress_view(body)(request)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content).decode(), body)
+        self.assertIn('Accept-Encoding', response['Vary'])
+    
+    def test_small_response_is_not_compressed(self):
+        """Test that responses under COMPRESSION_MIN_SIZE are sent as is."""
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip')
+        response = self.compress_view('<p>tiny</p>')(request)
+        self.assertFalse(response.has_header('Content-Encoding'))
+    
+    def test_binary_response_is_not_compressed(self):
+        """Test that non-text content types are left alone."""
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip')
+        response = self.compress_view(b'x' * 5000, content_type='image/png')(request)
+        self.assertFalse(response.has_header('Content-Encoding'))
+    
+    def test_html_is_never_brotli_compressed(self):
+        """Test that HTML, which cannot be padded under brotli, falls back to gzip."""
+        fake_brotli = SimpleNamespace(compress=lambda data, quality: b'br')
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='br, gzip')
+        with mock.patch('todo.compression.brotli', fake_brotli):
+            html = self.compress_view('<p>Todo</p>' * 500)(request)
+            json_response = self.compress_view('{"todo": 1}' * 500, content_type='application/json')(request)
+        self.assertEqual(html['Content-Encoding'], 'gzip')
+        self.assertEqual(json_response['Content-Encoding'], 'br')
+    
+    def test_choose_encoding_respects_quality(self):
+        """Test that encodings with q=0 are never chosen."""
+        self.assertEqual(choose_encoding('gzip, deflate', ['br', 'gzip']), 'gzip')
+        self.assertIsNone(choose_encoding('gzip;q=0', ['gzip']))
+        self.assertIsNone(choose_encoding('', ['gzip']))
+    
+    def test_todo_list_is_private(self):
+        """Test that todo_list responses are never stored by shared caches."""
+        User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(reverse('todo_list'))
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+    
+    def test_hashed_static_file_is_cached_forever(self):
+        """Test that hashed static files get far-future headers and gzip."""
+        path = os.path.join(self.static_root.name, 'app.0123456789ab.css')
+        with open(path, 'w') as f:
+            f.write('body { color: red; }')
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(b'body { color: red; }'))
+        
+        with override_settings(STATIC_ROOT=self.static_root.name):
+            request = self.factory.get('/static/app.0123456789ab.css', HTTP_ACCEPT_ENCODING='gzip')
+            response = serve_static(request, 'app.0123456789ab.css')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Content-Type'], 'text/css')
+            self.assertIn('immutable', response['Cache-Control'])
+            
+            request = self.factory.get('/static/app.0123456789ab.css')
+            response = serve_static(request, 'app.0123456789ab.css')
+            self.assertFalse(response.has_header('Content-Encoding'))
+    
+    def test_static_paths_cannot_leave_static_root(self):
+        """Test that '..' segments are rejected before touching the file system."""
+        with open(os.path.join(self.static_root.name, 'app.css'), 'w') as f:
+            f.write('body {}')
+        with override_settings(STATIC_ROOT=os.path.join(self.static_root.name, 'static')):
+            request = self.factory.get('/static/../app.css', HTTP_ACCEPT_ENCODING='gzip')
+            with mock.patch('os.path.exists') as exists, self.assertRaises(Http404):
+                serve_static(request, '../app.css')
+            exists.assert_not_called()
+
+
+@override_settings(SYNC_COMMIT_LAG_SECONDS=0)
+class SyncTests(TestCase):
+    """Test cases for the delta sync endpoint."""
+    
+    def setUp(self):
+        """Set up test data and a logged-in client."""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            password='testpass123'
+        )
+        self.client = Client()
+        self.client.login(username='testuser', password='testpass123')
+    
+    def sync(self, token=None, limit=None):
+        """Call the sync endpoint and return the decoded JSON."""
+        params = {}
+        if token:
+            params['token'] = token
+        if limit:
+            params['limit'] = limit
+        response = self.client.get(reverse('sync_todos'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+    
+    def test_initial_sync_returns_all_user_todos(self):
+        """Test that a sync without a token returns every todo of the user."""
+        todo = Todo.objects.create(title='Mine', user=self.user)
+        Todo.objects.create(title='Theirs', user=self.other_user)
+        page = self.sync()
+        self.assertEqual([change['id'] for change in page['changes']], [todo.id])
+        self.assertEqual(page['deleted'], [])
+        self.assertFalse(page['has_more'])
+    
+    def test_repeated_sync_returns_nothing(self):
+        """Test that syncing again with the returned token is empty."""
+        Todo.objects.create(title='Mine', user=self.user)
+        token = self.sync()['next_token']
+        with CaptureQueriesContext(connection) as captured:
+            page = self.sync(token)
+        self.assertEqual(page['changes'], [])
+        self.assertEqual(page['deleted'], [])
+        todo_queries = [q for q in captured if 'todo_todo' in q['sql'] or 'todotombstone' in q['sql']]
+        self.assertEqual(len(todo_queries), 2)
+    
+    def test_sync_returns_updates_and_deletions(self):
+        """Test that only changed and deleted todos follow a token."""
+        kept = Todo.objects.create(title='Kept', user=self.user)
+        changed = Todo.objects.create(title='Changed', user=self.user)
+        deleted = Todo.objects.create(title='Deleted', user=self.user)
+        token = self.sync()['next_token']
+        
+        changed.completed = True
+        changed.save()
+        deleted_id = deleted.id
+        deleted.delete()
+        
+        page = self.sync(token)
+        self.assertEqual([change['id'] for change in page['changes']], [changed.id])
+        self.assertTrue(page['changes'][0]['completed'])
+        self.assertEqual(page['deleted'], [deleted_id])
+        self.assertNotIn(kept.id, [change['id'] for change in page['changes']])
+    
+    def test_sync_pages_are_bounded(self):
+        """Test that large change sets are split into pages."""
+        for n in range(5):
+            Todo.objects.create(title=f'Todo {n}', user=self.user)
+        seen, token, pages = [], None, 0
+        while True:
+            page = self.sync(token, limit=2)
+            seen += [change['id'] for change in page['changes']]
+            token = page['next_token']
+            pages += 1
+            if not page['has_more']:
+                break
+        self.assertEqual(pages, 3)
+        self.assertEqual(sorted(seen), sorted(Todo.objects.values_list('id', flat=True)))
+    
+    def test_deleted_category_is_synced(self):
+        """Test that unsetting a deleted category counts as a change."""
+        category = Category.objects.create(name='Work')
+        todo = Todo.objects.create(title='Task', user=self.user, category=category)
+        token = self.sync()['next_token']
+        category.delete()
+        page = self.sync(token)
+        self.assertEqual(page['changes'][0]['id'], todo.id)
+        self.assertIsNone(page['changes'][0]['category'])
+    
+    def test_token_from_other_user_is_rejected(self):
+        """Test that a token issued to another user is refused."""
+        token = self.sync()['next_token']
+        self.client.login(username='otheruser', password='testpass123')
+        response = self.client.get(reverse('sync_todos'), {'token': token})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('sync_todos'), {'token': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_prune_tombstones_keeps_recent_ones(self):
+        """Test that pruning only drops tombstones past the retention."""
+        Todo.objects.create(title='Task', user=self.user).delete()
+        old = TodoTombstone.objects.create(todo_id=999, user=self.user)
+        TodoTombstone.objects.filter(pk=old.pk).update(deleted_at=datetime(2000, 1, 1, tzinfo=dt_timezone.utc))
+        call_command('prune_tombstones', stdout=StringIO())
+        self.assertEqual(TodoTombstone.objects.count(), 1)
+        self.assertFalse(TodoTombstone.objects.filter(pk=old.pk).exists())
+    
+    @override_settings(SYNC_COMMIT_LAG_SECONDS=60)
+    def test_late_commit_with_earlier_timestamp_is_synced(self):
+        """Test that the token does not pass rows whose transactions may still be open."""
+        first = Todo.objects.create(title='First', user=self.user)
+        token = self.sync()['next_token']
+        # Stamped before `first` but only committed now, by a slow transaction.
+        late = Todo.objects.create(title='Late', user=self.user)
+        Todo.objects.filter(pk=late.pk).update(updated_at=first.updated_at - timedelta(seconds=1))
+        page = self.sync(token)
+        self.assertIn(late.id, [change['id'] for change in page['changes']])
+        self.assertFalse(page['has_more'])
+    
+    def test_deleting_user_leaves_no_tombstones(self):
+        """Test that todos deleted along with their user get no tombstones."""
+        Todo.objects.create(title='Task', user=self.other_user)
+        user_id = self.other_user.pk
+        self.other_user.delete()
+        self.assertFalse(TodoTombstone.objects.filter(user_id=user_id).exists())
+
+
+class AdminPerformanceTests(TestCase):
+    """Test cases for the admin changelist performance mode."""
+    
+    def setUp(self):
+        """Set up a superuser, categories and todos."""
+        cache.clear()
+        self.admin = User.objects.create_superuser(
+            username='admin',
+            password='testpass123'
+        )
+        self.categories = [Category.objects.create(name=f'Category {n}') for n in range(3)]
+        for n in range(6):
+            Todo.objects.create(title=f'Task {n}', user=self.admin, category=self.categories[n % 3])
+        self.client = Client()
+        self.client.force_login(self.admin)
+    
+    def test_changelist_counts_once_and_skips_category_list(self):
+        """Test that the changelist runs one COUNT and never lists all categories."""
+        url = reverse('admin:todo_todo_changelist')
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url, {'category__id__exact': self.categories[0].pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 2)
+        sqls = [query['sql'] for query in captured]
+        self.assertEqual(len([sql for sql in sqls if 'COUNT(*)' in sql]), 1)
+        category_scans = [sql for sql in sqls if 'FROM "todo_category"' in sql and 'WHERE' not in sql]
+        self.assertEqual(category_scans, [])
+        self.assertContains(response, 'admin-autocomplete')
+    
+    def test_changelist_count_is_cached(self):
+        """Test that a second changelist load reuses the cached count."""
+        url = reverse('admin:todo_todo_changelist')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(url)
+        self.assertFalse([q for q in captured if 'COUNT(*)' in q['sql']])
+    
+    @override_settings(ADMIN_ESTIMATE_COUNT_THRESHOLD=1)
+    def test_large_tables_use_planner_estimate(self):
+        """Test that ANALYZE statistics replace COUNT(*) on big tables."""
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(estimate_count(Todo.objects.all()), 6)
+        self.assertIsNone(estimate_count(Todo.objects.filter(completed=True)))
+        paginator = EstimatedCountPaginator(Todo.objects.order_by('id'), 4)
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(paginator.count, 6)
+        self.assertFalse([q for q in captured if 'COUNT(*)' in q['sql']])
+    
+    @override_settings(ADMIN_PERFORMANCE_MODE=False)
+    def test_performance_mode_can_be_disabled(self):
+        """Test that the stock filters and counts return without performance mode."""
+        response = self.client.get(reverse('admin:todo_todo_changelist'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'autocomplete-filter')
+
+
+class RecurrenceTests(TestCase):
+    """Test cases for recurring todos and lazy occurrence expansion."""
+    
+    def setUp(self):
+        """Set up a daily recurring todo and a logged-in client."""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client = Client()
+        self.client.login(username='testuser', password='testpass123')
+        self.start = datetime.now(dt_timezone.utc).replace(hour=9, minute=0, second=0, microsecond=0)
+        self.todo = Todo.objects.create(title='Standup', user=self.user, due_date=self.start)
+        self.todo.set_recurrence(DAILY)
+    
+    def test_daily_expansion_jumps_to_window(self):
+        """Test that expansion starts at the window, not at the first occurrence."""
+        start = datetime(2000, 1, 1, 9, tzinfo=dt_timezone.utc)
+        window = datetime(2030, 6, 1, tzinfo=dt_timezone.utc)
+        occurrences = list(iter_occurrences(start, DAILY, 2, window, window + timedelta(days=6)))
+        self.assertEqual(len(occurrences), 3)
+        self.assertTrue(all(window <= when < window + timedelta(days=6) for when in occurrences))
+        self.assertEqual((occurrences[1] - occurrences[0]).days, 2)
+    
+    def test_weekly_expansion_respects_count_and_until(self):
+        """Test that count and until end a series."""
+        start = datetime(2030, 1, 7, 9, tzinfo=dt_timezone.utc)
+        end = start + timedelta(days=365)
+        self.assertEqual(len(list(iter_occurrences(start, WEEKLY, 1, start, end, count=3))), 3)
+        until = start + timedelta(days=14)
+        self.assertEqual(list(iter_occurrences(start, WEEKLY, 1, start, end, until=until))[-1], until)
+    
+    def test_monthly_expansion_skips_short_months(self):
+        """Test that a rule on the 31st skips months without one."""
+        start = datetime(2030, 1, 31, 9, tzinfo=dt_timezone.utc)
+        occurrences = list(iter_occurrences(start, MONTHLY, 1, start, datetime(2030, 6, 1, tzinfo=dt_timezone.utc)))
+        self.assertEqual([when.month for when in occurrences], [1, 3, 5])
+    
+    def test_monthly_count_ignores_skipped_months(self):
+        """Test that skipped months do not use up a rule's count."""
+        start = datetime(2030, 1, 31, 9, tzinfo=dt_timezone.utc)
+        end = datetime(2031, 1, 1, tzinfo=dt_timezone.utc)
+        occurrences = list(iter_occurrences(start, MONTHLY, 1, start, end, count=3))
+        self.assertEqual([when.month for when in occurrences], [1, 3, 5])
+        later = list(iter_occurrences(start, MONTHLY, 1, datetime(2030, 4, 1, tzinfo=dt_timezone.utc), end, count=3))
+        self.assertEqual([when.month for when in later], [5])
+    
+    def test_changing_frequency_keeps_interval(self):
+        """Test that set_recurrence only updates the fields it is given."""
+        self.todo.set_recurrence(WEEKLY, interval=3)
+        rule = self.todo.set_recurrence(MONTHLY)
+        rule.refresh_from_db()
+        self.assertEqual((rule.frequency, rule.interval), (MONTHLY, 3))
+    
+    def test_todo_list_shows_occurrences_in_window(self):
+        """Test that todo_list shows one occurrence per day of the window."""
+        response = self.client.get(reverse('todo_list'), {'days': 7})
+        occurrences = response.context['occurrences']
+        self.assertEqual(len(occurrences), 6)
+        self.assertEqual(occurrences[0].title, 'Standup')
+        self.assertEqual(Todo.objects.count(), 1)
+    
+    def test_completing_occurrence_materializes_one_row(self):
+        """Test that toggling an occurrence stores only that occurrence."""
+        response = self.client.get(reverse('todo_list'), {'days': 7})
+        occurrence = response.context['occurrences'][0]
+        self.client.post(reverse('toggle_occurrence', args=[self.todo.id, occurrence.key]))
+        
+        stored = Todo.objects.get(recurrence_parent=self.todo)
+        self.assertTrue(stored.completed)
+        self.assertEqual(stored.occurrence_date, occurrence.when)
+        response = self.client.get(reverse('todo_list'), {'days': 7})
+        self.assertEqual(len(response.context['occurrences']), 5)
+        self.assertIn(stored, response.context['todos'])
+    
+    def test_completing_first_occurrence_keeps_series(self):
+        """Test that completing the recurring todo itself leaves later occurrences listed."""
+        self.client.post(reverse('toggle_todo', args=[self.todo.id]))
+        self.todo.refresh_from_db()
+        self.assertTrue(self.todo.completed)
+        for params in ({'days': 7}, {'days': 7, 'status': 'pending'}):
+            response = self.client.get(reverse('todo_list'), params)
+            self.assertEqual(len(response.context['occurrences']), 6)
+        response = self.client.get(reverse('todo_list'), {'days': 7, 'status': 'pending'})
+        self.assertNotIn(self.todo, response.context['todos'])
+    
+    def test_deleted_occurrence_is_not_listed_again(self):
+        """Test that deleting a stored occurrence removes it from the series."""
+        response = self.client.get(reverse('todo_list'), {'days': 7})
+        occurrence = response.context['occurrences'][0]
+        self.client.post(reverse('toggle_occurrence', args=[self.todo.id, occurrence.key]))
+        stored = Todo.objects.get(recurrence_parent=self.todo)
+        
+        self.client.post(reverse('delete_todo', args=[stored.id]))
+        response = self.client.get(reverse('todo_list'), {'days': 7})
+        self.assertEqual(len(response.context['occurrences']), 5)
+        self.assertNotIn(occurrence.when, [o.when for o in response.context['occurrences']])
+        response = self.client.post(reverse('toggle_occurrence', args=[self.todo.id, occurrence.key]))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Todo.objects.filter(recurrence_parent=self.todo).exists())
+    
+    def test_deleted_occurrence_counts_towards_count(self):
+        """Test that a deleted occurrence still uses up the rule's count."""
+        rule = self.todo.recurrence
+        rule.count = 3
+        rule.save()
+        second = self.start + timedelta(days=1)
+        self.todo.materialize_occurrence(second).delete()
+        rule.refresh_from_db()
+        occurrences = list(rule.between(self.start, self.start + timedelta(days=7)))
+        self.assertEqual(occurrences, [self.start, self.start + timedelta(days=2)])
+    
+    def test_invalid_occurrence_returns_404(self):
+        """Test that a timestamp off the schedule cannot be materialized."""
+        when = int((self.start + timedelta(hours=1)).timestamp())
+        response = self.client.post(reverse('toggle_occurrence', args=[self.todo.id, when]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Todo.objects.count(), 1)
+    
+    def test_create_repeating_todo(self):
+        """Test that the repeat field on the form creates a rule."""
+        self.client.post(reverse('create_todo'), {'title': 'Gym', 'repeat': WEEKLY, 'completed': False})
+        rule = RecurrenceRule.objects.get(todo__title='Gym')
+        self.assertEqual(rule.frequency, WEEKLY)
+        self.assertEqual(rule.user, self.user)
+
+
+class TodoListRenderingTests(TestCase):
+    """Test cases for the values todo_list precomputes for home.html."""
+    
+    def setUp(self):
+        """Set up a user with categorized todos and a client."""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.categories = [Category.objects.create(name=f'Category {n}') for n in range(3)]
+        self.client = Client()
+        self.client.login(username='testuser', password='testpass123')
+    
+    def create_todos(self, count):
+        for n in range(count):
+            Todo.objects.create(
+                title=f'Task {n}',
+                description='one two three four five six seven eight nine ten eleven twelve',
+                user=self.user,
+                category=self.categories[n % 3],
+                due_date=timezone.now(),
+            )
+    
+    def test_url_template(self):
+        """Test that a reversed URL template formats into the real URLs."""
+        self.assertEqual(url_template('toggle_todo').format(42), reverse('toggle_todo', args=[42]))
+        self.assertEqual(
+            url_template('update_occurrence', 2).format(7, 1700000000),
+            reverse('update_occurrence', args=[7, 1700000000]),
+        )
+    
+    def test_query_count_does_not_grow_with_rows(self):
+        """Test that categories are not fetched once per row."""
+        self.create_todos(2)
+        self.client.get(reverse('todo_list'))  # cache the session's user
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse('todo_list'))
+        self.create_todos(10)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(reverse('todo_list'))
+        self.assertEqual(len(many), len(few))
+        self.assertContains(response, 'Category 1')
+    
+    def test_rows_and_filters_render_precomputed_values(self):
+        """Test the row URLs, excerpts, dates and selected filter options."""
+        self.create_todos(1)
+        todo = Todo.objects.get()
+        response = self.client.get(reverse('todo_list'), {
+            'category': self.categories[0].pk,
+            'status': 'pending',
+        })
+        self.assertContains(response, f'href="{reverse("update_todo", args=[todo.pk])}"')
+        self.assertContains(response, f'formaction="{reverse("toggle_todo", args=[todo.pk])}"')
+        self.assertContains(response, f'formaction="{reverse("delete_todo", args=[todo.pk])}"')
+        self.assertContains(response, 'one two three four five six seven eight nine ten …')
+        self.assertContains(response, timezone.localtime(todo.due_date).strftime('%b %d, %Y %H:%M'))
+        self.assertContains(response, f'<option value="{self.categories[0].pk}" selected>', html=False)
+        self.assertContains(response, f'<option value="{self.categories[1].pk}">', html=False)
+        self.assertContains(response, '<option value="pending" selected>Pending</option>', html=True)
+        self.assertContains(response, '<option value="completed">Completed</option>', html=True)
+
+
+class WorkspaceTests(TestCase):
+    """Test cases for workspaces and tenant-scoped data."""
+    
+    def setUp(self):
+        """Set up two users sharing a team workspace."""
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.teammate = User.objects.create_user(
+            username='teammate',
+            password='testpass123'
+        )
+        self.team = Workspace.objects.create(name='Team')
+        Membership.objects.create(workspace=self.team, user=self.user, role=Membership.OWNER)
+        Membership.objects.create(workspace=self.team, user=self.teammate)
+        self.client = Client()
+        self.client.login(username='testuser', password='testpass123')
+    
+    def switch_to_team(self):
+        self.client.get(reverse('todo_list'))  # start out in the personal workspace
+        response = self.client.post(reverse('switch_workspace'), {'workspace': self.team.pk})
+        self.assertRedirects(response, reverse('todo_list'))
+    
+    def test_personal_workspace_is_the_default(self):
+        """Test that users start in a personal workspace holding their older todos."""
+        legacy = Todo.objects.create(title='From before workspaces', user=self.user)
+        response = self.client.get(reverse('todo_list'))
+        personal = Workspace.objects.get(personal_for=self.user)
+        self.assertEqual(response.context['workspace'], personal)
+        self.assertTrue(Membership.objects.filter(workspace=personal, user=self.user, role=Membership.OWNER).exists())
+        self.assertIn(legacy, response.context['todos'])
+        self.client.post(reverse('create_todo'), {'title': 'New task'})
+        self.assertEqual(Todo.objects.get(title='New task').workspace, personal)
+    
+    def test_todos_are_scoped_to_the_current_workspace(self):
+        """Test that switching workspace switches the todos shown and created."""
+        personal_todo = Todo.objects.create(title='Personal task', user=self.user)
+        team_todo = Todo.objects.create(title='Team task', user=self.user, workspace=self.team)
+        self.switch_to_team()
+        response = self.client.get(reverse('todo_list'))
+        self.assertEqual(list(response.context['todos']), [team_todo])
+        self.assertContains(response, '<option value="%d" selected>Team</option>' % self.team.pk, html=True)
+        self.client.post(reverse('create_todo'), {'title': 'Another team task'})
+        self.assertEqual(Todo.objects.get(title='Another team task').workspace, self.team)
+        response = self.client.post(reverse('toggle_todo', args=[personal_todo.pk]))
+        self.assertEqual(response.status_code, 404)
+    
+    def test_categories_are_shared_within_a_workspace_only(self):
+        """Test that members share their workspace's categories and the global ones."""
+        shared = Category.objects.create(name='Everyone')
+        team_category = Category.objects.create(name='Team category', workspace=self.team)
+        other = Category.objects.create(name='Other team', workspace=Workspace.objects.create(name='Other'))
+        teammate = Client()
+        teammate.login(username='teammate', password='testpass123')
+        teammate.post(reverse('switch_workspace'), {'workspace': self.team.pk})
+        categories = teammate.get(reverse('category_list')).context['categories']
+        self.assertEqual(set(categories), {shared, team_category})
+        self.assertEqual(teammate.post(reverse('delete_category', args=[other.pk])).status_code, 404)
+        teammate.post(reverse('create_category'), {'name': 'Made by teammate'})
+        self.assertEqual(Category.objects.get(name='Made by teammate').workspace, self.team)
+    
+    def test_cannot_switch_to_a_foreign_workspace(self):
+        """Test that users can only switch to workspaces they belong to."""
+        other = Workspace.objects.create(name='Other')
+        response = self.client.post(reverse('switch_workspace'), {'workspace': other.pk})
+        self.assertEqual(response.status_code, 404)
+        Membership.objects.filter(workspace=self.team, user=self.user).delete()
+        session = self.client.session
+        session['_workspace_id'] = self.team.pk
+        session.save()
+        response = self.client.get(reverse('todo_list'))
+        self.assertEqual(response.context['workspace'], Workspace.objects.get(personal_for=self.user))
+    
+    def test_workspace_is_resolved_once_per_request(self):
+        """Test that repeated lookups reuse the first resolution."""
+        request = RequestFactory().get('/')
+        request.user = self.user
+        request.session = SessionStore()
+        self.assertEqual(get_workspace(request).personal_for, self.user)
+        with self.assertNumQueries(0):
+            get_workspace(request)
+    
+    def test_tenant_managers_need_a_workspace(self):
+        """Test that tenant managers return nothing outside a workspace."""
+        Todo.objects.create(title='Team task', user=self.user, workspace=self.team)
+        Todo.objects.create(title='Elsewhere', user=self.user, workspace=Workspace.objects.create(name='Other'))
+        self.assertFalse(Todo.tenant_objects.exists())
+        with use_workspace(self.team):
+            self.assertEqual([todo.title for todo in Todo.tenant_objects.all()], ['Team task'])
+    
+    def test_cache_invalidation_is_per_workspace(self):
+        """Test that invalidating one workspace keeps the others' cached values."""
+        use_shared_cache(self)
+        other = Workspace.objects.create(name='Other')
+        tenant_cache_get_or_set(self.team.pk, 'counter', lambda: 1)
+        tenant_cache_get_or_set(other.pk, 'counter', lambda: 2)
+        other_key = tenant_cache_key(other.pk, 'counter')
+        invalidate_tenant_cache(self.team.pk)
+        self.assertEqual(tenant_cache_get_or_set(self.team.pk, 'counter', lambda: 10), 10)
+        self.assertEqual(tenant_cache_key(other.pk, 'counter'), other_key)
+        self.assertEqual(tenant_cache_get_or_set(other.pk, 'counter', lambda: 20), 2)
+        invalidate_tenant_cache(None)
+        self.assertEqual(tenant_cache_get_or_set(other.pk, 'counter', lambda: 20), 20)
+    
+    def test_category_changes_refresh_only_their_workspace(self):
+        """Test that the todo list's cached categories follow category changes."""
+        use_shared_cache(self)
+        self.switch_to_team()
+        self.client.get(reverse('todo_list'))
+        personal = Workspace.objects.get(personal_for=self.user)
+        personal_key = tenant_cache_key(personal.pk, 'categories')
+        Category.objects.create(name='New team category', workspace=self.team)
+        self.assertContains(self.client.get(reverse('todo_list')), 'New team category')
+        self.assertEqual(tenant_cache_key(personal.pk, 'categories'), personal_key)
+    
+    def test_process_local_cache_is_not_used_for_tenant_data(self):
+        """Test that tenant values are recomputed when other workers could not see invalidations."""
+        self.assertEqual(tenant_cache_get_or_set(self.team.pk, 'counter', lambda: 1), 1)
+        self.assertEqual(tenant_cache_get_or_set(self.team.pk, 'counter', lambda: 2), 2)
+        self.switch_to_team()
+        # As if another worker created it: this process never hears of the change.
+        with mock.patch('todo.signals.invalidate_tenant_cache'):
+            Category.objects.create(name='Made elsewhere', workspace=self.team)
+        self.assertContains(self.client.get(reverse('todo_list')), 'Made elsewhere')
+
+
+class DirtyFieldWriteTests(TestCase):
+    """Test cases for dirty-field aware todo writes and write coalescing."""
+    
+    def setUp(self):
+        """Set up a user, a todo and a logged-in client."""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.category = Category.objects.create(name='Work')
+        self.todo = Todo.objects.create(
+            title='Test Todo',
+            description='Test Description',
+            user=self.user,
+            category=self.category
+        )
+        self.client = Client()
+        self.client.login(username='testuser', password='testpass123')
+    
+    def todo_updates(self, captured):
+        return [query['sql'] for query in captured if query['sql'].startswith('UPDATE "todo_todo"')]
+    
+    def form_data(self, **changes):
+        data = {'title': 'Test Todo', 'description': 'Test Description', 'category': self.category.pk}
+        data.update(changes)
+        return data
+    
+    def test_save_changes_tracks_loaded_values(self):
+        """Test that only changed fields are written, and nothing when unchanged."""
+        todo = Todo.objects.get(pk=self.todo.pk)
+        self.assertEqual(todo.changed_fields(), [])
+        with self.assertNumQueries(0):
+            self.assertEqual(todo.save_changes(), [])
+        todo.title = 'Renamed'
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(todo.save_changes(), ['title'])
+        [sql] = self.todo_updates(captured)
+        self.assertIn('"title"', sql)
+        self.assertNotIn('"description"', sql)
+        self.assertEqual(todo.changed_fields(), [])
+        self.assertIsNone(Todo(title='New', user=self.user).changed_fields())
+    
+    def test_toggle_writes_only_completed(self):
+        """Test that toggling updates completed and updated_at only."""
+        with CaptureQueriesContext(connection) as captured:
+            self.client.post(reverse('toggle_todo', args=[self.todo.pk]))
+        [sql] = self.todo_updates(captured)
+        self.assertIn('"completed"', sql)
+        self.assertIn('"updated_at"', sql)
+        self.assertNotIn('"title"', sql)
+        self.todo.refresh_from_db()
+        self.assertTrue(self.todo.completed)
+    
+    def test_unchanged_update_skips_the_write(self):
+        """Test that submitting the edit form unchanged writes nothing."""
+        updated_at = self.todo.updated_at
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post(reverse('update_todo', args=[self.todo.pk]), self.form_data())
+        self.assertRedirects(response, reverse('todo_list'))
+        self.assertEqual(self.todo_updates(captured), [])
+        self.assertFalse([q for q in captured if 'todo_recurrencerule' in q['sql'] and 'DELETE' in q['sql']])
+        self.todo.refresh_from_db()
+        self.assertEqual(self.todo.updated_at, updated_at)
+    
+    def test_update_writes_only_changed_fields(self):
+        """Test that an edit writes just the edited column."""
+        with CaptureQueriesContext(connection) as captured:
+            self.client.post(reverse('update_todo', args=[self.todo.pk]), self.form_data(title='Renamed'))
+        [sql] = self.todo_updates(captured)
+        self.assertIn('"title"', sql)
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn('"category_id"', sql)
+        self.todo.refresh_from_db()
+        self.assertEqual(self.todo.title, 'Renamed')
+    
+    def test_patch_todo(self):
+        """Test the JSON edit endpoint, including no-op and invalid edits."""
+        url = reverse('patch_todo', args=[self.todo.pk])
+        response = self.client.patch(url, {'completed': True, 'title': 'Test Todo'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['changed_fields'], ['completed'])
+        self.assertTrue(response.json()['todo']['completed'])
+        response = self.client.patch(url, {'completed': True}, content_type='application/json')
+        self.assertEqual(response.json()['changed_fields'], [])
+        response = self.client.patch(url, {'title': '', 'owner': 1}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'title', 'owner'})
+        self.assertEqual(self.client.patch(url, '[1]', content_type='application/json').status_code, 400)
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.client.force_login(other)
+        self.assertEqual(self.client.patch(url, {}, content_type='application/json').status_code, 404)
+
+
+class WriteCoalescingTests(TransactionTestCase):
+    """Test cases for merging bursts of JSON edits into one write."""
+    
+    def setUp(self):
+        """Set up a user and a todo."""
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.todo = Todo.objects.create(title='Test Todo', user=self.user)
+    
+    async def patch(self, url, edit):
+        # Like ASGIHandler, give every request its own thread for sync code.
+        async with ThreadSensitiveContext():
+            return await self.async_client.patch(url, json.dumps(edit), content_type='application/json')
+    
+    @override_settings(TODO_WRITE_COALESCE_SECONDS=0.2)
+    def test_patch_bursts_are_coalesced(self):
+        """Test that concurrent edits to one todo are merged into one write."""
+        self.async_client.force_login(self.user)
+        # Resolve the workspace up front so the requests themselves only read.
+        session = self.async_client.session
+        session['_workspace_id'] = Workspace.objects.personal(self.user).pk
+        session.save()
+        url = reverse('patch_todo', args=[self.todo.pk])
+        
+        async def burst():
+            return await asyncio.gather(*(
+                self.patch(url, edit)
+                for edit in ({'title': 'Renamed'}, {'description': 'Merged'}, {'completed': True})
+            ))
+        
+        # Run the burst in a plain event loop, as an ASGI server would.
+        bodies = [response.json() for response in asyncio.run(burst())]
+        self.assertEqual([body['merged_edits'] for body in bodies], [3, 3, 3])
+        self.assertEqual(bodies[0]['changed_fields'], ['title', 'description', 'completed'])
+        self.todo.refresh_from_db()
+        self.assertEqual((self.todo.title, self.todo.description, self.todo.completed), ('Renamed', 'Merged', True))
+
+
+class LoadTestHarnessTests(LiveServerTestCase):
+    """Test cases for the asyncio load generator."""
+    
+    def setUp(self):
+        """Set up a staff user who can log in through the admin form."""
+        User.objects.create_user(
+            username='loaduser',
+            password='testpass123',
+            is_staff=True
+        )
+    
+    def test_run_load_logs_in_and_replays_mix(self):
+        """Test that a short run logs in and exercises every action."""
+        stats, elapsed = asyncio.run(run_load(
+            self.live_server_url, [('loaduser', 'testpass123')], duration=1.5,
+            mix={'list': 1, 'create': 1, 'toggle': 1, 'delete': 1},
+        ))
+        self.assertEqual(stats.failed, 0, stats.errors)
+        self.assertEqual(len(stats.latencies['login']), 2)
+        self.assertGreater(len(stats.latencies['list']), 0)
+        self.assertGreater(len(stats.latencies['create']), 0)
+        self.assertGreater(stats.statuses[302], 1)  # login plus the redirects after writes
+    
+    def test_stats_histogram_and_percentiles(self):
+        """Test that latencies land in the right histogram buckets."""
+        stats = Stats()
+        for seconds in (0.0005, 0.003, 0.003, 0.2, 9):
+            stats.record('list', seconds, status=200)
+        stats.record('list', 0.01, error='TimeoutError')
+        histogram = dict(stats.histogram('list'))
+        self.assertEqual(histogram[1], 1)
+        self.assertEqual(histogram[5], 2)
+        self.assertEqual(histogram[HISTOGRAM_BUCKETS[-1]], 1)
+        self.assertEqual(stats.failed, 1)
+        self.assertEqual(stats.percentile([1, 2, 3, 4], 0.5), 3)
+    
+    def test_unexpected_statuses_count_as_failures(self):
+        """Test that 4xx and other unexpected statuses are failures, not successes."""
+        stats = Stats()
+        stats.record('create', 0.01, status=302)
+        stats.record('create', 0.01, status=403)
+        stats.record('login', 0.01, status=200, expect=(302,))
+        self.assertEqual(stats.failed, 2)
+        self.assertEqual(stats.errors['create: HTTP 403'], 1)
+    
+    def test_chained_lock_tracebacks_count_once(self):
+        """Test that a chained sqlite3/Django traceback is one lock error."""
+        try:
+            try:
+                raise sqlite3.OperationalError('database is locked')
+            except sqlite3.OperationalError as exc:
+                raise OperationalError('database is locked') from exc
+        except OperationalError:
+            log = 'Internal Server Error: /todos/create/\n' + traceback.format_exc()
+        message = 'OperationalError: database is locked'
+        self.assertEqual(log.count(message), 2)
+        self.assertEqual(count_tracebacks(log, message), 1)
+        self.assertEqual(count_tracebacks(log * 3, message), 3)
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_MAX_RECORDS=2)
+class ProfilingTests(TestCase):
+    """Test cases for the on-demand profiling middleware."""
+    
+    def setUp(self):
+        """Set up a staff user, a regular user and their todos."""
+        self.staff = User.objects.create_superuser(
+            username='staff',
+            password='testpass123'
+        )
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        Todo.objects.create(title='Profiled task', user=self.staff)
+        self.client = Client()
+    
+    @override_settings(PROFILING_ENABLED=False)
+    def test_middleware_is_removed_when_disabled(self):
+        """Test that the middleware drops out of the chain when disabled."""
+        with self.assertRaises(MiddlewareNotUsed):
+            ProfilingMiddleware(lambda request: HttpResponse())
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('todo_list'), HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(ProfileRecord.objects.exists())
+    
+    def test_staff_request_with_header_is_profiled(self):
+        """Test that the header stores a profile with a summary and stacks."""
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('todo_list'), HTTP_X_PROFILE='1')
+        self.assertContains(response, 'Profiled task')
+        record = ProfileRecord.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual(record.view_name, 'todo_list')
+        self.assertEqual(record.user, self.staff)
+        self.assertEqual(record.status_code, 200)
+        self.assertIn('todo_list', record.summary)
+        for line in record.collapsed.splitlines():
+            stack, count = line.rsplit(' ', 1)
+            self.assertTrue(stack.startswith('call_view'))
+            self.assertGreater(int(count), 0)
+    
+    def test_query_parameter_and_record_limit(self):
+        """Test that ?__profile=1 works and only the newest records are kept."""
+        self.client.force_login(self.staff)
+        for _ in range(3):
+            response = self.client.get(reverse('todo_list'), {'__profile': '1'})
+            self.assertIn('X-Profile-Id', response)
+        self.assertEqual(ProfileRecord.objects.count(), 2)
+        self.assertTrue(ProfileRecord.objects.filter(pk=response['X-Profile-Id']).exists())
+    
+    def test_non_staff_and_unflagged_requests_are_not_profiled(self):
+        """Test that only flagged requests from staff users are profiled."""
+        self.client.force_login(self.staff)
+        self.assertNotIn('X-Profile-Id', self.client.get(reverse('todo_list')))
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('todo_list'), HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(ProfileRecord.objects.exists())
+    
+    def test_admin_shows_summary_and_downloads_stacks(self):
+        """Test the admin change page and the collapsed-stack download."""
+        self.client.force_login(self.staff)
+        record_id = self.client.get(reverse('todo_list'), HTTP_X_PROFILE='1')['X-Profile-Id']
+        download_url = reverse('admin:todo_profilerecord_collapsed', args=[record_id])
+        response = self.client.get(reverse('admin:todo_profilerecord_change', args=[record_id]))
+        self.assertContains(response, download_url)
+        self.assertContains(response, 'cumulative')
+        response = self.client.get(download_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'profile-{record_id}.folded', response['Content-Disposition'])
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(download_url).status_code, 302)
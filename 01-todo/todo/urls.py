@@ -8,6 +8,11 @@ urlpatterns = [
     path('<int:todo_id>/update/', views.update_todo, name='update_todo'),
     path('<int:todo_id>/delete/', views.delete_todo, name='delete_todo'),
     path('<int:todo_id>/toggle/', views.toggle_todo, name='toggle_todo'),
+    path('<int:todo_id>/patch/', views.patch_todo, name='patch_todo'),
+    path('<int:todo_id>/occurrences/<int:occurrence>/toggle/', views.toggle_occurrence, name='toggle_occurrence'),
+    path('<int:todo_id>/occurrences/<int:occurrence>/update/', views.update_occurrence, name='update_occurrence'),
+    path('sync/', views.sync_todos, name='sync_todos'),
+    path('workspace/', views.switch_workspace, name='switch_workspace'),
     
     # Category URLs
     path('categories/', views.category_list, name='category_list'),
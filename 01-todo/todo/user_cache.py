@@ -0,0 +1,65 @@
+"""The authenticated user, cached for the lifetime of a session.
+
+Used by CachedAuthenticationMiddleware; todo.signals drops cached users
+when they change. Kept apart from the middleware so the signal handlers do
+not import the HTTP stack.
+"""
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+
+from .tenancy import cache_is_shared
+
+
+def user_cache_key(user_id):
+    """Return the cache key holding the authenticated user with this id."""
+    return f'todo:auth-user:{user_id}'
+
+
+def user_cache_enabled():
+    """Return True if users may be cached.
+
+    Only with a cache shared by every worker process: todo.signals could
+    otherwise only drop a changed user from the worker that saved it, and
+    the others would keep honouring a revoked password or permission.
+    """
+    return cache_is_shared()
+
+
+def get_cached_user(request):
+    """Return the session's user, served from the cache when possible.
+
+    A cached user is only trusted if the session still carries that user's
+    auth hash, so a password change logs other sessions out exactly like
+    django.contrib.auth.get_user() does. Anything unusual is handed to
+    get_user() itself, as is every request when the cache is not shared
+    between processes (see user_cache_enabled()).
+    """
+    if not user_cache_enabled():
+        return auth.get_user(request)
+
+    user_id = request.session.get(SESSION_KEY)
+    if user_id is None:
+        return AnonymousUser()
+
+    key = user_cache_key(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = auth.get_user(request)
+        if user.is_authenticated:
+            cache.set(key, user, getattr(settings, 'USER_CACHE_TIMEOUT', settings.SESSION_COOKIE_AGE))
+        return user
+
+    session_hash = request.session.get(HASH_SESSION_KEY)
+    backend_path = request.session.get(BACKEND_SESSION_KEY)
+    if (
+        backend_path not in settings.AUTHENTICATION_BACKENDS
+        or not session_hash
+        or not constant_time_compare(session_hash, user.get_session_auth_hash())
+    ):
+        return auth.get_user(request)
+    user.backend = backend_path
+    return user
@@ -1,34 +1,133 @@
+import json
+import mimetypes
+import os
+import re
+from datetime import datetime, timedelta, timezone as dt_timezone
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.utils import timezone
+from django.urls import reverse
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.formats import date_format
+from django.utils.text import Truncator
+from django.views.decorators.cache import cache_control
 from django.views.decorators.http import require_http_methods
-from django.http import JsonResponse
-from .models import Todo, Category
+from django.views.static import serve
+from django.http import Http404, JsonResponse
+from .coalescing import get_coalescer
+from .compression import choose_encoding
+from .middleware import WORKSPACE_SESSION_KEY, get_workspace
+from .models import Todo, Category, Workspace
 from .forms import TodoForm, CategoryForm
+from .storage import ENCODING_SUFFIXES
+from .sync import InvalidSyncToken, serialize_todo, sync_page
+from .tenancy import tenant_cache_get_or_set
 
+# Fields the JSON edit endpoint accepts.
+PATCHABLE_FIELDS = ['title', 'description', 'category', 'due_date', 'completed']
 
+# Matches the content hash ManifestStaticFilesStorage puts in file names.
+HASHED_STATIC_RE = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+
+STATUS_CHOICES = [('pending', 'Pending'), ('completed', 'Completed')]
+
+DUE_DATE_FORMAT = 'M d, Y H:i'
+
+
+def url_template(name, arity=1):
+    """Reverse a URL once and return a str.format() template for its integer arguments."""
+    markers = [str(987654320 + n) for n in range(arity)]
+    url = reverse(name, args=markers)
+    for index, marker in enumerate(markers):
+        url = url.replace(marker, '{%d}' % index)
+    return url
+
+
+def prepare_rows(todos, occurrences, categories):
+    """Precompute everything home.html shows per row.
+    
+    URLs are reversed once per request instead of once per row, and each
+    row's category is taken from the categories already loaded for the
+    filter (categories are not sharded, so they cannot be joined to todos).
+    """
+    categories_by_id = {category.id: category for category in categories}
+    update_url = url_template('update_todo')
+    toggle_url = url_template('toggle_todo')
+    delete_url = url_template('delete_todo')
+    for todo in todos:
+        todo.category = categories_by_id.get(todo.category_id)
+        todo.update_url = update_url.format(todo.id)
+        todo.toggle_url = toggle_url.format(todo.id)
+        todo.delete_url = delete_url.format(todo.id)
+        todo.excerpt = Truncator(todo.description).words(10, truncate=' …')
+        if todo.due_date:
+            todo.due_display = date_format(timezone.template_localtime(todo.due_date), DUE_DATE_FORMAT)
+    
+    update_occurrence_url = url_template('update_occurrence', 2)
+    toggle_occurrence_url = url_template('toggle_occurrence', 2)
+    for occurrence in occurrences:
+        occurrence.todo.category = categories_by_id.get(occurrence.todo.category_id)
+        occurrence.update_url = update_occurrence_url.format(occurrence.id, occurrence.key)
+        occurrence.toggle_url = toggle_occurrence_url.format(occurrence.id, occurrence.key)
+        occurrence.when_display = date_format(timezone.template_localtime(occurrence.when), DUE_DATE_FORMAT)
+
+
+@cache_control(private=True, no_cache=True)
 @login_required
 def todo_list(request):
     """Display all todos for the logged-in user."""
-    todos = Todo.objects.filter(user=request.user)
-    categories = Category.objects.all()
+    workspace = get_workspace(request)
+    todos = Todo.tenant_objects.for_user(request.user)
+    categories = tenant_cache_get_or_set(workspace.pk, 'categories', lambda: list(Category.tenant_objects.all()))
     
     # Filter by category if provided
     category_id = request.GET.get('category')
     if category_id:
         todos = todos.filter(category_id=category_id)
     
-    # Filter by completion status if provided
+    # Upcoming occurrences of recurring todos, expanded only for the window shown
+    try:
+        days = min(max(int(request.GET.get('days', 14)), 1), 366)
+    except ValueError:
+        days = 14
+    window_start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    window_end = window_start + timedelta(days=days)
+    
+    # Filter by completion status if provided. A recurring todo stands for
+    # its first occurrence only, so completing it does not end the series.
     status = request.GET.get('status')
     if status == 'completed':
+        # Occurrences that are not stored yet are never completed
+        occurrences = []
         todos = todos.filter(completed=True)
-    elif status == 'pending':
-        todos = todos.filter(completed=False)
+    else:
+        occurrences = todos.occurrences(window_start, window_end)
+        if status == 'pending':
+            todos = todos.filter(completed=False)
+    
+    todos = list(todos)
+    prepare_rows(todos, occurrences, categories)
+    
+    # Filter options, with the selected one flagged
+    category_options = [
+        (category.id, category.name, str(category.id) == category_id) for category in categories
+    ]
+    status_options = [(value, label, value == status) for value, label in STATUS_CHOICES]
     
     context = {
         'todos': todos,
+        'occurrences': occurrences,
         'categories': categories,
+        'category_options': category_options,
+        'status_options': status_options,
         'selected_category': category_id,
         'selected_status': status,
+        'workspace': workspace,
+        'workspaces': Workspace.objects.filter(memberships__user=request.user).order_by('name'),
     }
     return render(request, 'todo/home.html', context)
 
@@ -41,7 +140,10 @@ def create_todo(request):
         if form.is_valid():
             todo = form.save(commit=False)
             todo.user = request.user
+            todo.workspace = get_workspace(request)
             todo.save()
+            if form.cleaned_data.get('repeat'):
+                todo.set_recurrence(form.cleaned_data['repeat'])
             return redirect('todo_list')
     else:
         form = TodoForm()
@@ -52,12 +154,14 @@ def create_todo(request):
 @login_required
 def update_todo(request, todo_id):
     """Update an existing todo."""
-    todo = get_object_or_404(Todo, id=todo_id, user=request.user)
+    todo = get_object_or_404(Todo.tenant_objects.for_user(request.user), id=todo_id)
     
     if request.method == 'POST':
         form = TodoForm(request.POST, instance=todo)
         if form.is_valid():
-            form.save()
+            form.save(commit=False).save_changes()
+            if 'repeat' in form.changed_data:
+                todo.set_recurrence(form.cleaned_data['repeat'])
             return redirect('todo_list')
     else:
         form = TodoForm(instance=todo)
@@ -69,7 +173,7 @@ def update_todo(request, todo_id):
 @require_http_methods(["POST"])
 def delete_todo(request, todo_id):
     """Delete a todo."""
-    todo = get_object_or_404(Todo, id=todo_id, user=request.user)
+    todo = get_object_or_404(Todo.tenant_objects.for_user(request.user), id=todo_id)
     todo.delete()
     return redirect('todo_list')
 
@@ -78,16 +182,150 @@ def delete_todo(request, todo_id):
 @require_http_methods(["POST"])
 def toggle_todo(request, todo_id):
     """Toggle the completion status of a todo."""
-    todo = get_object_or_404(Todo, id=todo_id, user=request.user)
+    todo = get_object_or_404(Todo.tenant_objects.for_user(request.user), id=todo_id)
     todo.completed = not todo.completed
-    todo.save()
+    todo.save_changes()
+    return redirect('todo_list')
+
+
+def get_occurrence(request, todo_id, occurrence):
+    """Return the stored row for an occurrence of one of the user's recurring todos."""
+    todo = get_object_or_404(
+        Todo.tenant_objects.for_user(request.user).select_related('recurrence'),
+        id=todo_id,
+        recurrence__isnull=False,
+    )
+    try:
+        when = datetime.fromtimestamp(occurrence, tz=dt_timezone.utc)
+        return todo.materialize_occurrence(when)
+    except (ValueError, OverflowError, OSError):
+        raise Http404('No such occurrence.')
+
+
+@login_required
+@require_http_methods(["POST"])
+def toggle_occurrence(request, todo_id, occurrence):
+    """Toggle the completion status of one occurrence of a recurring todo."""
+    todo = get_occurrence(request, todo_id, occurrence)
+    todo.completed = not todo.completed
+    todo.save_changes()
     return redirect('todo_list')
 
 
+@login_required
+@require_http_methods(["POST"])
+def update_occurrence(request, todo_id, occurrence):
+    """Store one occurrence of a recurring todo and open it for editing."""
+    todo = get_occurrence(request, todo_id, occurrence)
+    return redirect('update_todo', todo_id=todo.id)
+
+
+def clean_todo_changes(request, todo_id, data):
+    """Validate a JSON object of field changes to one of the user's todos.
+    
+    Returns the cleaned values; raises ValidationError for unknown fields
+    or invalid values.
+    """
+    todo = get_object_or_404(Todo.tenant_objects.for_user(request.user), id=todo_id)
+    form = TodoForm(instance=todo)
+    changes, errors = {}, {}
+    for name, value in data.items():
+        if name not in PATCHABLE_FIELDS:
+            errors[name] = ['Unknown field.']
+            continue
+        try:
+            changes[name] = form.fields[name].clean(value)
+        except ValidationError as exc:
+            errors[name] = exc.messages
+    if errors:
+        raise ValidationError(errors)
+    return changes
+
+
+def apply_todo_changes(request, todo_id, changes):
+    """Write changes to one of the user's todos; returns (todo, changed fields)."""
+    todo = get_object_or_404(Todo.tenant_objects.for_user(request.user), id=todo_id)
+    for name, value in changes.items():
+        setattr(todo, name, value)
+    return todo, todo.save_changes()
+
+
+@login_required
+@require_http_methods(["PATCH", "POST"])
+async def patch_todo(request, todo_id):
+    """Apply a JSON object of field changes to a todo and return the stored todo.
+    
+    Only changed columns are written, and nothing at all if nothing
+    changed. With TODO_WRITE_COALESCE_SECONDS set, bursts of edits to the
+    same todo are merged into one write (see todo.coalescing).
+    """
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'The body must be a JSON object.'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'The body must be a JSON object.'}, status=400)
+    try:
+        changes = await sync_to_async(clean_todo_changes)(request, todo_id, data)
+    except ValidationError as exc:
+        return JsonResponse({'errors': exc.message_dict}, status=400)
+    
+    async def write(changes):
+        return await sync_to_async(apply_todo_changes)(request, todo_id, changes)
+    
+    coalescer = get_coalescer()
+    if coalescer is None:
+        (todo, changed), edits = await write(changes), 1
+    else:
+        user = await request.auser()
+        (todo, changed), edits = await coalescer.submit((user.pk, todo_id), changes, write)
+    return JsonResponse({
+        'todo': serialize_todo(todo),
+        'changed_fields': changed,
+        'merged_edits': edits,
+    })
+
+
+@cache_control(private=True, no_cache=True)
+@login_required
+@require_http_methods(["GET"])
+def sync_todos(request):
+    """Return the todos changed or deleted since the client's sync token."""
+    try:
+        limit = int(request.GET.get('limit') or 0) or None
+    except ValueError:
+        return JsonResponse({'error': 'limit must be an integer.'}, status=400)
+    try:
+        page = sync_page(request.user, request.GET.get('token'), limit)
+    except InvalidSyncToken as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse(page)
+
+
+@login_required
+@require_http_methods(["POST"])
+def switch_workspace(request):
+    """Make another of the user's workspaces the current one."""
+    workspace = get_object_or_404(
+        Workspace.objects.filter(memberships__user=request.user), id=request.POST.get('workspace') or 0
+    )
+    request.session[WORKSPACE_SESSION_KEY] = workspace.pk
+    return redirect('todo_list')
+
+
+def editable_categories(request):
+    """Return the categories the request may change: its workspace's own.
+    
+    Categories shared by every workspace (workspace=None) are read-only.
+    """
+    return Category.objects.filter(workspace=get_workspace(request))
+
+
+@cache_control(private=True, no_cache=True)
 @login_required
 def category_list(request):
     """Display all categories."""
-    categories = Category.objects.all()
+    categories = Category.tenant_objects.all()
     return render(request, 'todo/category_list.html', {'categories': categories})
 
 
@@ -97,7 +335,9 @@ def create_category(request):
     if request.method == 'POST':
         form = CategoryForm(request.POST)
         if form.is_valid():
-            form.save()
+            category = form.save(commit=False)
+            category.workspace = get_workspace(request)
+            category.save()
             return redirect('category_list')
     else:
         form = CategoryForm()
@@ -108,7 +348,7 @@ def create_category(request):
 @login_required
 def update_category(request, category_id):
     """Update an existing category."""
-    category = get_object_or_404(Category, id=category_id)
+    category = get_object_or_404(editable_categories(request), id=category_id)
     
     if request.method == 'POST':
         form = CategoryForm(request.POST, instance=category)
@@ -125,6 +365,37 @@ def update_category(request, category_id):
 @require_http_methods(["POST"])
 def delete_category(request, category_id):
     """Delete a category."""
-    category = get_object_or_404(Category, id=category_id)
+    category = get_object_or_404(editable_categories(request), id=category_id)
     category.delete()
     return redirect('category_list')
+
+
+def serve_static(request, path):
+    """Serve collected static files with long-lived caching and pre-compression.
+    
+    Used when DEBUG is off and no front-end server handles STATIC_URL.
+    Hashed names never change content, so they are cached for a year.
+    """
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('"%s" does not exist' % path)
+    encoding = choose_encoding(
+        request.META.get('HTTP_ACCEPT_ENCODING', ''),
+        [enc for enc, suffix in ENCODING_SUFFIXES.items() if os.path.exists(full_path + suffix)],
+    )
+    if encoding:
+        response = serve(request, path + ENCODING_SUFFIXES[encoding], document_root=settings.STATIC_ROOT)
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        response.headers['Content-Type'] = content_type
+        response.headers['Content-Encoding'] = encoding
+        del response.headers['Content-Disposition']
+    else:
+        response = serve(request, path, document_root=settings.STATIC_ROOT)
+    
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if HASHED_STATIC_RE.search(path):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'public, max-age=300'
+    return response
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -23,9 +24,10 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = "django-insecure-^)*4t^91$cd(x8-%+p)mra)njbt*$8xubvmykuiv7e%d4!v@w^"
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# Set DJANGO_DEBUG=0 to run with the production static and template setup.
+DEBUG = os.environ.get("DJANGO_DEBUG", "1") == "1"
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = ["localhost", "127.0.0.1", "[::1]"]
 
 
 # Application definition
@@ -41,13 +43,18 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "todo.middleware.ReplicaPinningMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "todo.middleware.CompressionMiddleware",
+    "django.middleware.http.ConditionalGetMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
-    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "todo.middleware.CachedAuthenticationMiddleware",
+    "todo.middleware.WorkspaceMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "todo.middleware.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "todoproject.urls"
@@ -67,6 +74,18 @@ TEMPLATES = [
     },
 ]
 
+# Outside DEBUG, templates are compiled once per process and never re-read
+# from disk. In DEBUG, Django's default loaders apply, which also cache but
+# drop the cache when the autoreloader sees a template change.
+if not DEBUG:
+    TEMPLATES[0]["APP_DIRS"] = False
+    TEMPLATES[0]["OPTIONS"]["loaders"] = [
+        ("django.template.loaders.cached.Loader", [
+            "django.template.loaders.filesystem.Loader",
+            "django.template.loaders.app_directories.Loader",
+        ]),
+    ]
+
 WSGI_APPLICATION = "todoproject.wsgi.application"
 
 
@@ -80,6 +99,148 @@ DATABASES = {
     }
 }
 
+# Read replicas. Reads go to one of REPLICA_DATABASES and writes to
+# "default"; a client is pinned to "default" for REPLICA_PIN_SECONDS after
+# each write. Point TODO_REPLICA_DB at a second SQLite file to try it out
+# locally (run `manage.py migrate --database replica` once).
+REPLICA_DATABASES = []
+
+if os.environ.get("TODO_REPLICA_DB"):
+    DATABASES["replica"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.environ["TODO_REPLICA_DB"],
+        "TEST": {"MIRROR": "default"},
+    }
+    REPLICA_DATABASES.append("replica")
+
+# Sharding. Todos are partitioned by user across TODO_SHARDS; users and
+# categories stay on "default". Set TODO_SHARD_DBS to a comma-separated list
+# of SQLite files to add local shards, then migrate each one and run
+# `manage.py rebalance_shards` whenever the list changes. Todo ids are
+# unique across shards: the last digits of an id (in base 1024) are the
+# number in TODO_SHARD_NUMBERS of the shard that created it, so never give a
+# number to a second database, even after its shard is gone.
+TODO_SHARDS = ["default"]
+
+TODO_SHARD_NUMBERS = {"default": 0}
+
+for number, name in enumerate(filter(None, os.environ.get("TODO_SHARD_DBS", "").split(",")), 1):
+    DATABASES[f"shard{number}"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": name,
+    }
+    TODO_SHARDS.append(f"shard{number}")
+    TODO_SHARD_NUMBERS[f"shard{number}"] = number
+
+DATABASE_ROUTERS = [
+    "todo.routers.UserShardRouter",
+    "todo.routers.PrimaryReplicaRouter",
+]
+
+REPLICA_PIN_SECONDS = 5
+
+# Adds a second shard for the test suite (see todo.test_runner).
+TEST_RUNNER = "todo.test_runner.ShardedTestRunner"
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+
+# Sessions and authentication. With a cache shared by all workers (Redis,
+# Memcached, ...) sessions are read from the cache and only fall back to the
+# database on a miss. The process-local LocMemCache would let one worker
+# keep serving a session another worker logged out or changed, so with it
+# sessions stay in the database. Set TODO_SESSION_ENGINE to
+# "django.contrib.sessions.backends.signed_cookies" to skip the session
+# store entirely. CachedAuthenticationMiddleware keeps the logged-in User in
+# the cache for USER_CACHE_TIMEOUT seconds, under the same condition: with a
+# process-local cache every request reads the user from the database.
+# Settings modules that change CACHES must set SESSION_ENGINE again.
+
+PROCESS_LOCAL_CACHE_BACKENDS = [
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+]
+
+SESSION_ENGINE = os.environ.get(
+    "TODO_SESSION_ENGINE",
+    "django.contrib.sessions.backends.db"
+    if CACHES["default"]["BACKEND"] in PROCESS_LOCAL_CACHE_BACKENDS
+    else "django.contrib.sessions.backends.cached_db",
+)
+
+USER_CACHE_TIMEOUT = 60 * 60 * 24 * 14  # SESSION_COOKIE_AGE
+
+
+# Delta sync (todo.sync). Pages hold at most SYNC_PAGE_SIZE changes and
+# deletions; tombstones older than SYNC_TOMBSTONE_RETENTION_DAYS are removed
+# by `manage.py prune_tombstones` and clients idle for longer resync fully.
+# Rows stamped within SYNC_COMMIT_LAG_SECONDS are sent but not passed by the
+# token, as a slower transaction may still commit a row stamped before them;
+# keep it above the longest write transaction.
+SYNC_PAGE_SIZE = 500
+
+SYNC_TOMBSTONE_RETENTION_DAYS = 30
+
+SYNC_COMMIT_LAG_SECONDS = 5
+
+
+# Admin performance mode (todo.admin). Changelists use planner estimates for
+# unfiltered tables above ADMIN_ESTIMATE_COUNT_THRESHOLD rows, cache counts
+# for ADMIN_COUNT_CACHE_SECONDS and filter categories through autocomplete.
+ADMIN_PERFORMANCE_MODE = True
+
+ADMIN_ESTIMATE_COUNT_THRESHOLD = 100_000
+
+ADMIN_COUNT_CACHE_SECONDS = 60
+
+
+# Logging. Request errors (including SQLite "database is locked") always go
+# to the console so servers and the loadtest command can see them.
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {
+            "class": "logging.StreamHandler",
+        },
+    },
+    "loggers": {
+        "django.request": {
+            "handlers": ["console"],
+            "level": "ERROR",
+            "propagate": False,
+        },
+    },
+}
+
+
+# Window in which edits to one todo through the JSON endpoint are merged
+# into a single write (todo.coalescing). Only useful under ASGI; 0 is off.
+TODO_WRITE_COALESCE_SECONDS = float(os.environ.get("TODO_WRITE_COALESCE_SECONDS", "0"))
+
+# Lifetime of values cached per workspace (see todo.tenancy). They are only
+# cached with a cache shared by all workers.
+TENANT_CACHE_TIMEOUT = 300
+
+# On-demand profiling (todo.middleware.ProfilingMiddleware). When enabled,
+# staff requests sent with "X-Profile: 1" or "?__profile=1" are profiled and
+# stored for the admin; the newest PROFILING_MAX_RECORDS are kept.
+PROFILING_ENABLED = os.environ.get("TODO_PROFILING") == "1"
+
+PROFILING_HEADER = "X-Profile"
+
+PROFILING_SAMPLE_INTERVAL = 0.001  # seconds
+
+PROFILING_MAX_RECORDS = 200
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -117,6 +278,26 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
+STATIC_ROOT = BASE_DIR / "staticfiles"
+
+# Outside DEBUG, collectstatic writes content-hashed copies (plus .gz/.br
+# siblings) that todo.views.serve_static serves with far-future headers.
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": (
+            "django.contrib.staticfiles.storage.StaticFilesStorage"
+            if DEBUG
+            else "todo.storage.CompressedManifestStaticFilesStorage"
+        ),
+    },
+}
+
+# Responses smaller than this many bytes are sent uncompressed.
+COMPRESSION_MIN_SIZE = 1024
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
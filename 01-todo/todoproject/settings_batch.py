@@ -0,0 +1,25 @@
+"""
+Lean settings for batch management commands and ORM-only workers.
+
+Use with DJANGO_SETTINGS_MODULE=todoproject.settings_batch, e.g.
+
+    DJANGO_SETTINGS_MODULE=todoproject.settings_batch python manage.py prune_tombstones
+
+Everything is inherited from todoproject.settings except what only serves
+HTTP: the admin, messages and staticfiles apps, the middleware and the
+URLconf. Django then skips importing them at startup; see the
+bench_startup command for the difference it makes.
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS
+
+INSTALLED_APPS = [
+    app
+    for app in INSTALLED_APPS
+    if app not in ("django.contrib.admin", "django.contrib.messages", "django.contrib.staticfiles")
+]
+
+MIDDLEWARE = []
+
+ROOT_URLCONF = "todoproject.urls_batch"
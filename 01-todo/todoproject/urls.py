@@ -15,12 +15,19 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.views.generic import RedirectView
+from todo.views import serve_static
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("todos/", include('todo.urls')),
     path("", RedirectView.as_view(url='todos/', permanent=False)),
 ]
+
+if not settings.DEBUG:
+    urlpatterns += [
+        re_path(r"^%s(?P<path>.*)$" % settings.STATIC_URL.lstrip("/"), serve_static),
+    ]
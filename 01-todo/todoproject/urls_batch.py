@@ -0,0 +1,6 @@
+"""
+Empty URL configuration used by todoproject.settings_batch, which serves no
+HTTP requests.
+"""
+
+urlpatterns = []